@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from pulse import forms
-from pulse.models import (BlipSet, RSSProvider, FlickrProvider, BambooBuildsProvider,
+from pulse.models import (BlipSet, UpdateRun, RSSProvider, FlickrProvider, BambooBuildsProvider,
                           KunenaProvider, TracTimelineProvider, FileSystemChangeProvider, GoogleDocsProvider)
 
 
@@ -10,8 +10,16 @@ class PasswordModelAdmin(admin.ModelAdmin):
     form = forms.PasswordModelForm
 
 
+class UpdateRunAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'started', 'fetch_time', 'parse_time', 'write_time', 'bytes_downloaded',
+                    'entries_seen', 'blips_created', 'error')
+    list_filter = ('provider',)
+    date_hierarchy = 'started'
+
+
 # Blips, etc
 admin.site.register(BlipSet)
+admin.site.register(UpdateRun, UpdateRunAdmin)
 
 
 
@@ -0,0 +1,153 @@
+"""Read-only JSON API for blipsets, blips and tags
+
+Takes the same filters as the timeline (``tags`` and ``timestamp``, plus ``blipset`` for blips) and the same keyset
+pagination cursors (``before``/``after``), with ``limit`` setting the page size.  Pages come back as::
+
+    {"objects": [...], "newer": <cursor or null>, "older": <cursor or null>}
+
+Search results are ranked rather than in time order, so they're paged by number instead (``page``), coming back as
+``{"objects": [...], "page": 1, "has_next": false}``
+
+The JSON is written out object by object as the response is sent rather than built up in memory first.  Every
+response carries an ETag and Last-Modified based on the newest blipset, so pollers get a 304 until something new has
+been ingested
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.views.decorators.http import condition, require_GET
+
+from pulse.forms import SearchForm, TagFilterForm
+from pulse.models import BlipSet, Blip, TagCount, prefetch_tags
+from pulse.pagination import paginate
+from pulse.search import SearchUnavailable
+from pulse.views import BlipFilterSet, BlipSetFilterSet, filter_by_tags, find_blips, get_cursors, get_page_number
+
+
+def get_latest(request):
+    """The pk and timestamp of the newest blipset, looked up once per request"""
+    if not hasattr(request, '_pulse_latest'):
+        request._pulse_latest = BlipSet.objects.aggregate(pk=Max('pk'), timestamp=Max('timestamp'))
+    return request._pulse_latest
+
+
+def latest_etag(request, *args, **kwargs):
+    latest = get_latest(request)
+    return hashlib.md5('%s|%s|%s' % (latest['pk'], latest['timestamp'], request.get_full_path())).hexdigest()
+
+
+def latest_modified(request, *args, **kwargs):
+    return get_latest(request)['timestamp']
+
+
+def get_page_size(request):
+    """The ``limit`` asked for, or the timeline's page size, capped at PULSE_API_MAX_PAGE_SIZE"""
+    page_size = getattr(settings, 'PULSE_TIMELINE_PAGE_SIZE', 50)
+    try:
+        page_size = int(request.GET.get('limit', page_size))
+    except ValueError:
+        pass
+    return max(1, min(page_size, getattr(settings, 'PULSE_API_MAX_PAGE_SIZE', 500)))
+
+
+def blipset_to_dict(blipset):
+    return {
+        'id': blipset.pk,
+        'url': blipset.get_absolute_url(),
+        'timestamp': blipset.timestamp.isoformat(),
+        'summary': unicode(blipset),
+        'provider': blipset.provider.name if blipset.provider_id else None,
+        'blip_count': blipset.blip_count,
+        'authors': blipset.author_list,
+        'tags': [t.name for t in blipset.tag_list],
+    }
+
+
+def blip_to_dict(blip):
+    return {
+        'id': blip.pk,
+        'url': blip.get_absolute_url(),
+        'timestamp': blip.timestamp.isoformat(),
+        'title': blip.title,
+        'summary': blip.summary,
+        'who': blip.who,
+        'source_url': blip.source_url,
+        'blipset': blip.blipset_id,
+        'tags': [t.name for t in blip.tag_list],
+    }
+
+
+def stream_page(page, to_dict):
+    yield '{"objects": ['
+    for i, obj in enumerate(page.object_list):
+        yield (',' if i else '') + json.dumps(to_dict(obj))
+    yield '], "newer": %s, "older": %s}' % (json.dumps(page.newer_cursor), json.dumps(page.older_cursor))
+
+
+def stream_results(object_list, page, has_next):
+    yield '{"objects": ['
+    for i, blip in enumerate(object_list):
+        yield (',' if i else '') + json.dumps(blip_to_dict(blip))
+    yield '], "page": %d, "has_next": %s}' % (page, json.dumps(has_next))
+
+
+def stream_tags(tag_counts):
+    yield '{"objects": ['
+    for i, tag_count in enumerate(tag_counts):
+        yield (',' if i else '') + json.dumps({'name': tag_count.tag.name, 'slug': tag_count.tag.slug,
+                                               'count': tag_count.count})
+    yield ']}'
+
+
+def json_response(chunks):
+    return HttpResponse(chunks, content_type='application/json')
+
+
+@require_GET
+@condition(etag_func=latest_etag, last_modified_func=latest_modified)
+def blipsets(request):
+    queryset = filter_by_tags(BlipSet.objects.select_related('provider'), TagFilterForm(request.GET or None))
+    queryset = BlipSetFilterSet(request.GET, queryset=queryset).qs
+    page = paginate(queryset, get_page_size(request), **get_cursors(request.GET))
+    prefetch_tags(page.object_list)
+    return json_response(stream_page(page, blipset_to_dict))
+
+
+@require_GET
+@condition(etag_func=latest_etag, last_modified_func=latest_modified)
+def blips(request):
+    queryset = filter_by_tags(Blip.objects.all(), TagFilterForm(request.GET or None))
+    queryset = BlipFilterSet(request.GET, queryset=queryset).qs
+    page = paginate(queryset, get_page_size(request), **get_cursors(request.GET))
+    prefetch_tags(page.object_list)
+    return json_response(stream_page(page, blip_to_dict))
+
+
+@require_GET
+@condition(etag_func=latest_etag, last_modified_func=latest_modified)
+def tags(request):
+    """Tags with their counts, for either the ``blipsets`` (the default) or the ``blips``"""
+    model = {'blipsets': BlipSet, 'blips': Blip}.get(request.GET.get('model', 'blipsets'))
+    if model is None:
+        raise Http404
+    tag_counts = TagCount.objects.filter(content_type=ContentType.objects.get_for_model(model), count__gt=0)
+    return json_response(stream_tags(tag_counts.select_related('tag').order_by('tag__name').iterator()))
+
+
+@require_GET
+@condition(etag_func=latest_etag, last_modified_func=latest_modified)
+def search(request):
+    """Blips matching ``q``, best match first, a ``page`` at a time"""
+    form = SearchForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(json.dumps(form.errors), content_type='application/json')
+    page = get_page_number(request.GET)
+    try:
+        object_list, has_next = find_blips(form.cleaned_data['q'], get_page_size(request), page)
+    except SearchUnavailable:
+        raise Http404
+    return json_response(stream_results(object_list, page, has_next))
@@ -0,0 +1,138 @@
+"""Retention: moving old blipsets, with their blips and tags, out of the tables the timeline queries
+
+Blipsets are kept for their provider's retention_days, or PULSE_RETENTION_DAYS for providers without one (and for
+blipsets without a provider); with neither set they're kept forever.  ``manage.py archive_blipsets`` moves the expired
+ones in batches, each in its own transaction, into ArchivedBlipSet and ArchivedBlip, taking their TaggedItems and search
+index entries with them, bringing the TagCounts down to match and throwing away the feeds' snapshots.  The rows are
+deleted with plain SQL, since going through the ORM would fire the per-object signal handlers that are there for one-off
+edits.  The detail pages fall back to the archived copies, so links to archived blipsets and blips keep working
+"""
+import datetime
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from taggit.models import TaggedItem
+
+from pulse.feeds import invalidate_snapshots
+from pulse.models import (BULK_CREATE_BATCH_SIZE, LOOKUP_BATCH_SIZE, ArchivedBlip, ArchivedBlipSet, Blip, BlipSet,
+                          Provider, adjust_tag_counts, prefetch_tags)
+from pulse.search import unindex_blips
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 500
+
+
+def expired_blipsets(when=None):
+    """The pks of the blipsets past their retention period, oldest first"""
+    when = when or now()
+    default = getattr(settings, 'PULSE_RETENTION_DAYS', None)
+    by_days = {}
+    for pk, days in Provider.base_objects.values_list('pk', 'retention_days'):
+        if days is None:
+            days = default
+        if days is not None:
+            by_days.setdefault(days, []).append(pk)
+
+    conditions = [Q(provider__in=pks, timestamp__lt=when - datetime.timedelta(days=days))
+                  for days, pks in by_days.items()]
+    if default is not None:
+        conditions.append(Q(provider__isnull=True, timestamp__lt=when - datetime.timedelta(days=default)))
+    if not conditions:
+        return []
+    return list(BlipSet.objects.filter(reduce(lambda a, b: a | b, conditions))
+                .order_by('timestamp', 'pk').values_list('pk', flat=True))
+
+
+def _chunks(items):
+    """Split a list up to keep IN (...) lists under the bound-parameter limits"""
+    for i in xrange(0, len(items), LOOKUP_BATCH_SIZE):
+        yield items[i:i + LOOKUP_BATCH_SIZE]
+
+
+def _tag_data(obj):
+    return [[tag.name, tag.slug] for tag in obj.tag_list]
+
+
+def _delete(model, column, values):
+    cursor = connection.cursor()
+    for chunk in _chunks(list(values)):
+        cursor.execute("DELETE FROM %s WHERE %s IN (%s)" % (connection.ops.quote_name(model._meta.db_table),
+                                                            connection.ops.quote_name(column),
+                                                            ', '.join(['%s'] * len(chunk))), chunk)
+
+
+def _delete_tagged_items(objects):
+    """Remove the objects' TaggedItems (which must be loaded into their tag_list), adjusting the TagCounts"""
+    if not objects:
+        return
+    content_type = ContentType.objects.get_for_model(objects[0])
+    deltas = {}
+    for obj in objects:
+        for tag in obj.tag_list:
+            deltas[tag.pk] = deltas.get(tag.pk, 0) - 1
+    cursor = connection.cursor()
+    for chunk in _chunks([obj.pk for obj in objects]):
+        cursor.execute("DELETE FROM %s WHERE content_type_id = %%s AND object_id IN (%s)" % (
+                       connection.ops.quote_name(TaggedItem._meta.db_table), ', '.join(['%s'] * len(chunk))),
+                       [content_type.pk] + chunk)
+    adjust_tag_counts(content_type.pk, deltas)
+
+
+def archive_blipsets(pks):
+    """Move the blipsets with the given pks, and everything hanging off them, into the archive
+
+    Should be run in a transaction, so they're never half moved.  Returns how many blipsets and blips were archived
+    """
+    blipsets = []
+    blips = []
+    for chunk in _chunks(list(pks)):
+        blipsets.extend(BlipSet.objects.filter(pk__in=chunk).select_related('provider'))
+        blips.extend(Blip.objects.filter(blipset__in=chunk))
+    for chunk in _chunks(blipsets):
+        prefetch_tags(chunk)
+    for chunk in _chunks(blips):
+        prefetch_tags(chunk)
+
+    archived_blipsets = [ArchivedBlipSet(pk=bs.pk, timestamp=bs.timestamp, provider_id=bs.provider_id,
+                                         data=json.dumps({'summary': bs.__unicode__() or u'',
+                                                          'blip_count': bs.blip_count, 'authors': bs.authors,
+                                                          'tags': _tag_data(bs)}))
+                         for bs in blipsets]
+    archived_blips = [ArchivedBlip(pk=b.pk, blipset_id=b.blipset_id, timestamp=b.timestamp,
+                                   data=json.dumps({'source_url': b.source_url, 'title': b.title, 'summary': b.summary,
+                                                    'who': b.who, 'ingest_key': b.ingest_key, 'tags': _tag_data(b)}))
+                      for b in blips]
+    for model, objects in ((ArchivedBlipSet, archived_blipsets), (ArchivedBlip, archived_blips)):
+        for i in xrange(0, len(objects), BULK_CREATE_BATCH_SIZE):
+            model.objects.bulk_create(objects[i:i + BULK_CREATE_BATCH_SIZE])
+
+    _delete_tagged_items(blips)
+    _delete_tagged_items(blipsets)
+    if blips:
+        unindex_blips([b.pk for b in blips])
+        _delete(Blip, 'id', [b.pk for b in blips])
+    _delete(BlipSet, 'id', [bs.pk for bs in blipsets])
+    transaction.set_dirty()
+    return len(blipsets), len(blips)
+
+
+def archive_expired(batch_size=ARCHIVE_BATCH_SIZE, when=None):
+    """Archive every blipset past its retention period, a batch per transaction; returns the blipset and blip counts"""
+    pks = expired_blipsets(when)
+    totals = [0, 0]
+    for i in xrange(0, len(pks), batch_size):
+        with transaction.commit_on_success():
+            counts = archive_blipsets(pks[i:i + batch_size])
+        totals[0] += counts[0]
+        totals[1] += counts[1]
+        logger.debug("Archived %d blipsets and %d blips", *counts)
+    if totals[0]:
+        invalidate_snapshots()
+    return tuple(totals)
@@ -0,0 +1,222 @@
+"""Benchmarks for the ingest and timeline paths, run against synthetic data
+
+SyntheticData fills the database with providers, blipsets and blips (tagged with a long-tailed distribution, a few tags
+on most things and lots of rarely used ones) and writes out Trac timeline feeds and inotify change logs in the same
+formats as the test data in pulse/tests.  run() then times each stage, returning plain dicts so the results can be
+dumped as JSON and compared between runs; see the benchmark management command
+"""
+import datetime
+import os
+import random
+import resource
+import time
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries, transaction
+from django.db.models import Max
+from django.test.client import Client
+from django.utils.timezone import utc
+
+from pulse.models import (BULK_CREATE_BATCH_SIZE, Blip, BlipSet, FileSystemChangeProvider, RSSProvider,
+                          TracTimelineProvider, bulk_add_tags, join_authors)
+from pulse.search import index_blips
+from pulse.templatetags.pulse_extras import fragment_cache
+
+
+START = datetime.datetime(2012, 1, 1, tzinfo=utc)
+CHANGE_LOG_ACTIONS = ('CREATE', 'MODIFY', 'MODIFY', 'MODIFY', 'DELETE', 'MOVE')
+TRAC_KINDS = ('changeset', 'changeset', 'changeset', 'ticket', 'closedticket', 'wiki')
+
+
+class SyntheticData(object):
+    """Generates the data to benchmark against, the same every time for a given seed"""
+
+    def __init__(self, directory, seed=0, tag_count=200, author_count=30):
+        self.directory = directory
+        self.random = random.Random(seed)
+        self.tags = ['tag%d' % i for i in xrange(tag_count)]
+        # Zipf-like, so the first few tags are everywhere and most of the rest hardly ever turn up
+        self.tag_weights = [1.0 / (i + 1) ** 1.1 for i in xrange(tag_count)]
+        self.authors = ['Person %d' % i for i in xrange(author_count)]
+
+    def pick_tags(self):
+        tags = set()
+        for _ in xrange(self.random.randint(1, 4)):
+            tags.add(self._weighted_choice())
+        return sorted(tags)
+
+    def _weighted_choice(self):
+        point = self.random.uniform(0, sum(self.tag_weights))
+        for tag, weight in zip(self.tags, self.tag_weights):
+            point -= weight
+            if point <= 0:
+                return tag
+        return self.tags[-1]
+
+    def write_trac_feed(self, name, entries):
+        """Write a Trac timeline feed like pulse/tests/trac.xml with the given number of entries, newest first"""
+        path = os.path.join(self.directory, '%s.xml' % name)
+        with open(path, 'w') as f:
+            f.write('<?xml version="1.0"?>\n<rss xmlns:dc="http://purl.org/dc/elements/1.1/" version="2.0">\n'
+                    '  <channel>\n    <title>%s</title>\n    <link>https://example.com/%s/timeline</link>\n'
+                    '    <description>Trac Timeline</description>\n' % (name, name))
+            for i in xrange(entries, 0, -1):
+                timestamp = START + datetime.timedelta(minutes=i)
+                kind = self.random.choice(TRAC_KINDS)
+                f.write('    <item>\n      <title>%s</title>\n      <dc:creator>%s</dc:creator>\n'
+                        '      <pubDate>%s</pubDate>\n      <link>https://example.com/%s/%s/%d</link>\n'
+                        '      <guid isPermaLink="false">https://example.com/%s/%s/%d</guid>\n'
+                        '      <description>%s</description>\n      <category>%s</category>\n    </item>\n' % (
+                            escape('%s %d: Did some stuff' % (kind.capitalize(), i)),
+                            escape('%s <person@example.com>' % self.random.choice(self.authors)),
+                            timestamp.strftime('%a, %d %b %Y %H:%M:%S GMT'), name, kind, i, name, kind, i,
+                            escape('<p>Changed <em>%d</em> files</p>' % self.random.randint(1, 50)), kind))
+            f.write('  </channel>\n</rss>\n')
+        return path
+
+    def write_change_log(self, name, lines):
+        """Write an inotify change log like pulse/tests/modify.log with (about) the given number of lines"""
+        path = os.path.join(self.directory, '%s.log' % name)
+        with open(path, 'w') as f:
+            for i in xrange(lines):
+                timestamp = (START + datetime.timedelta(seconds=i)).strftime('%H:%M:%S %d:%m:%Y')
+                directory = '/c/%s/' % self.random.choice(('Administrative', 'Engineering', 'Sales'))
+                action = self.random.choice(CHANGE_LOG_ACTIONS)
+                filename = 'file%d.doc' % self.random.randint(0, lines)
+                if action == 'MOVE':
+                    f.write('%s|%s|MOVED_FROM|%s\n' % (timestamp, directory, filename))
+                    f.write('%s|%s|MOVED_TO|renamed-%s\n' % (timestamp, directory, filename))
+                else:
+                    f.write('%s|%s|%s|%s\n' % (timestamp, directory, action, filename))
+        return path
+
+    def create_providers(self, count, entries, log_lines):
+        """Create ``count`` providers, cycling through the Trac, plain RSS and filesystem types"""
+        providers = []
+        for i in xrange(count):
+            kind = i % 3
+            if kind == 0:
+                provider = TracTimelineProvider(name='trac%d' % i, url=self.write_trac_feed('trac%d' % i, entries))
+            elif kind == 1:
+                provider = RSSProvider(name='rss%d' % i, url=self.write_trac_feed('rss%d' % i, entries))
+            else:
+                provider = FileSystemChangeProvider(name='files%d' % i, source_url_root='//data/',
+                                                    change_log_path=self.write_change_log('files%d' % i, log_lines))
+            provider.update_frequency = 5
+            provider.save()
+            provider.tags.add(*self.pick_tags())
+            providers.append(provider)
+        return providers
+
+    def create_timeline(self, blipsets, blips):
+        """Fill the timeline with ``blipsets`` blipsets holding ``blips`` blips between them, all tagged and indexed"""
+        with transaction.commit_on_success():
+            sizes = [1] * blipsets
+            for _ in xrange(max(0, blips - blipsets)):
+                sizes[self.random.randrange(blipsets)] += 1
+
+            last_pk = BlipSet.objects.aggregate(pk=Max('pk'))['pk'] or 0
+            for start in xrange(0, blipsets, BULK_CREATE_BATCH_SIZE):
+                batch = []
+                for i in xrange(start, min(start + BULK_CREATE_BATCH_SIZE, blipsets)):
+                    batch.append(BlipSet(summary='%d synthetic updates' % sizes[i], blip_count=sizes[i],
+                                         authors=join_authors(self.random.sample(self.authors, min(sizes[i], 3)))))
+                BlipSet.objects.bulk_create(batch)
+            created = list(BlipSet.objects.filter(pk__gt=last_pk).order_by('pk'))
+            for i, blipset in enumerate(created):
+                # spread them out over time, as auto_now_add would have them all at once
+                blipset.timestamp = START + datetime.timedelta(hours=i)
+                BlipSet.objects.filter(pk=blipset.pk).update(timestamp=blipset.timestamp)
+            bulk_add_tags([(bs, self.pick_tags()) for bs in created])
+
+            new_blips = []
+            for blipset, size in zip(created, sizes):
+                for j in xrange(size):
+                    new_blips.append(Blip(blipset=blipset, title='Synthetic blip %d' % j, summary='<p>Did stuff</p>',
+                                          source_url='http://example.com/', who=self.random.choice(self.authors),
+                                          timestamp=blipset.timestamp))
+            for i in xrange(0, len(new_blips), BULK_CREATE_BATCH_SIZE):
+                Blip.objects.bulk_create(new_blips[i:i + BULK_CREATE_BATCH_SIZE])
+            saved = list(Blip.objects.filter(blipset__in=[bs.pk for bs in created]).order_by('pk'))
+            bulk_add_tags([(b, self.pick_tags()) for b in saved])
+            index_blips([b.pk for b in saved])
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far (KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextmanager
+def measure(results, name, **extra):
+    """Time the block, counting its queries and how much it raised the peak memory use, adding a result for it
+
+    Peak memory can only ever go up, so rss_growth_kb is how much further this stage pushed it (0 if it stayed within
+    what earlier stages had already used)
+    """
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    reset_queries()
+    rss_before = peak_rss_kb()
+    start = time.time()
+    try:
+        yield extra
+    finally:
+        result = {
+            'name': name,
+            'wall_time': time.time() - start,
+            'queries': len(connection.queries),
+            'peak_rss_kb': peak_rss_kb(),
+            'rss_growth_kb': peak_rss_kb() - rss_before,
+        }
+        result.update(extra)
+        results.append(result)
+        connection.use_debug_cursor = old_debug_cursor
+        reset_queries()
+
+
+def run(directory, providers=6, entries=500, log_lines=5000, blipsets=1000, blips=5000, seed=0, repeat=3):
+    """Generate the synthetic data in the (current, presumably test) database and benchmark it, returning the results"""
+    data = SyntheticData(directory, seed=seed)
+    results = []
+
+    created = data.create_providers(providers, entries, log_lines)
+    for provider_class in (TracTimelineProvider, RSSProvider, FileSystemChangeProvider):
+        of_class = [p for p in created if type(p) is provider_class]
+        if of_class:
+            with measure(results, 'update.%s' % provider_class.__name__, providers=len(of_class)) as extra:
+                for provider in of_class:
+                    provider.update()
+                extra['blips'] = Blip.objects.filter(blipset__provider__in=of_class).count()
+
+    # parsing alone, with nothing saved
+    for provider in created:
+        if isinstance(provider, FileSystemChangeProvider):
+            provider.log_inode = None
+            provider.last_update = START - datetime.timedelta(days=1)
+            with measure(results, 'parse.change_log', lines=log_lines) as extra:
+                extra['blips'] = len(provider._fetch_blips())
+            break
+    for provider in created:
+        if isinstance(provider, RSSProvider):
+            provider.newest_first = False
+            provider.last_update = START - datetime.timedelta(days=1)
+            with measure(results, 'parse.feed', entries=entries) as extra:
+                extra['blips'] = len(provider._parse_blips(open(provider.url, 'rb')))
+            break
+
+    with measure(results, 'generate.timeline', blipsets=blipsets, blips=blips):
+        data.create_timeline(blipsets, blips)
+
+    client = Client()
+    url = reverse('timeline')
+    for i in xrange(repeat):
+        fragment_cache.clear()
+        with measure(results, 'timeline.cold', run=i) as extra:
+            extra['status'] = client.get(url).status_code
+    for i in xrange(repeat):
+        with measure(results, 'timeline.warm', run=i) as extra:
+            extra['status'] = client.get(url).status_code
+    return results
@@ -0,0 +1,143 @@
+"""Runs provider updates, optionally spreading them over a pool of worker threads
+
+There are two ways of running a pass.  update_providers() has each worker update a provider from start to finish.
+run_pipeline() splits every update in two: the fetching happens on a large pool of threads that do nothing but wait on
+the network, so hundreds of slow feeds can be fetched at once, and their parsing and saving happens on a small pool
+feeding the database.  Python 2 has no event loop to build the I/O side on, but threads spend their time blocked in
+socket calls with the GIL released, which gives much the same overlap
+"""
+import logging
+import time
+from multiprocessing.pool import ThreadPool
+
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateResult(object):
+    """Outcome of updating a single provider"""
+
+    def __init__(self, provider, elapsed, error=None):
+        self.provider = provider
+        self.elapsed = elapsed
+        self.error = error
+
+    def __unicode__(self):
+        status = 'failed: %s' % self.error if self.error else 'done'
+        return u"%s %s %s in %.2fs" % (self.provider.__class__.__name__, self.provider, status, self.elapsed)
+
+
+def update_provider(provider, close_connection=False):
+    """Update a single provider, timing it and capturing any error so one bad provider can't sink the whole pass
+
+    When running in a worker thread the thread's DB connection is closed afterwards, so every provider's writes go
+    through their own connection and nothing is left dangling once the pool shuts down
+    """
+    start = time.time()
+    error = None
+    try:
+        provider.update()
+    except Exception as e:
+        logger.exception("Updating %s %s failed", provider.__class__.__name__, provider)
+        error = e
+    finally:
+        if close_connection:
+            connection.close()
+    return UpdateResult(provider, time.time() - start, error)
+
+
+def _update_in_worker(provider):
+    return update_provider(provider, close_connection=True)
+
+
+def update_providers(providers, workers=1):
+    """Update all of the given providers, returning an UpdateResult for each one
+
+    With more than one worker, the providers are handed to a bounded thread pool so one slow feed no longer holds up
+    the others.  Each provider still runs its own fetch-then-save cycle, so ``last_update`` is only advanced for the
+    providers that actually ingested something
+    """
+    providers = list(providers)
+    if workers <= 1 or len(providers) <= 1:
+        return [update_provider(p) for p in providers]
+
+    pool = ThreadPool(min(workers, len(providers)))
+    try:
+        return pool.map(_update_in_worker, providers, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _fetch_in_worker(job):
+    index, provider = job
+    start = time.time()
+    provider.begin_run()
+    try:
+        return index, provider, provider.fetch_raw(), None, time.time() - start
+    except Exception as e:
+        logger.exception("Fetching %s %s failed", provider.__class__.__name__, provider)
+        return index, provider, None, e, time.time() - start
+    finally:
+        connection.close()
+
+
+def ingest_provider(provider, raw, fetch_elapsed=0, close_connection=False):
+    """Parse and save what was fetched for a provider, capturing any error as update_provider does
+
+    This finishes off the provider's UpdateRun, begun when the fetch started
+    """
+    start = time.time()
+    error = None
+    try:
+        provider.ingest(provider.parse_blips(raw))
+    except Exception as e:
+        logger.exception("Ingesting %s %s failed", provider.__class__.__name__, provider)
+        error = e
+    finally:
+        provider.end_run(error)
+        if close_connection:
+            connection.close()
+    return UpdateResult(provider, fetch_elapsed + time.time() - start, error)
+
+
+def _ingest_in_worker(provider, raw, fetch_elapsed):
+    return ingest_provider(provider, raw, fetch_elapsed, close_connection=True)
+
+
+def run_pipeline(providers, fetch_workers=20, workers=1):
+    """Update all of the given providers with separate pools for fetching and for parsing/saving
+
+    ``fetch_workers`` threads fetch the providers that are due (see Provider._fetch_raw), handing each one on to the
+    ``workers`` threads that parse and save it as soon as it arrives; with a single worker that's done by the calling
+    thread.  The per-host limits of the shared fetch session still apply, so many fetch workers won't swamp any one
+    server.  Returns an UpdateResult for each provider, in order
+    """
+    providers = list(providers)
+    results = [UpdateResult(p, 0) for p in providers]
+    due = [(i, p) for i, p in enumerate(providers) if p.is_due()]
+    if not due:
+        return results
+
+    pools = [ThreadPool(min(fetch_workers, len(due)))]
+    if workers > 1:
+        pools.append(ThreadPool(workers))
+    try:
+        pending = []
+        for index, provider, raw, error, elapsed in pools[0].imap_unordered(_fetch_in_worker, due):
+            if error is not None:
+                provider.end_run(error)
+                results[index] = UpdateResult(provider, elapsed, error)
+            elif workers > 1:
+                pending.append((index, pools[1].apply_async(_ingest_in_worker, (provider, raw, elapsed))))
+            else:
+                results[index] = ingest_provider(provider, raw, elapsed)
+        for index, result in pending:
+            results[index] = result.get()
+    finally:
+        for pool in pools:
+            pool.close()
+            pool.join()
+    return results
@@ -0,0 +1,193 @@
+"""Atom feeds of the timeline, and of the blipsets/blips carrying each tag
+
+Building a feed from scratch means loading and rendering a page's worth of blipsets, which would happen on every poll
+by every reader.  Instead each feed keeps a snapshot of its items in the cache, noting the newest blipset at the time.
+Until another blipset arrives the snapshot is served as is; once one does, only the objects added since are loaded and
+merged in.  Editing or deleting anything that might already be in a snapshot (or archiving it) throws all of the
+snapshots away, so they're rebuilt from scratch.  The feeds also answer conditional GETs (see pulse.api), so most polls
+never get as far as the snapshot
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import get_cache
+from django.core.urlresolvers import reverse
+from django.db.models import signals
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.utils.feedgenerator import Atom1Feed
+from django.views.decorators.http import condition
+from taggit.models import Tag, TaggedItem
+
+from pulse.api import get_latest, latest_etag, latest_modified
+from pulse.models import BlipSet, Blip, Provider, prefetch_blipsets, prefetch_tags
+
+
+feed_cache = get_cache(getattr(settings, 'PULSE_FRAGMENT_CACHE', 'default'))
+
+GENERATION_KEY = 'pulse-feed-generation'
+
+
+def _cache_timeout():
+    return getattr(settings, 'PULSE_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def invalidate_snapshots():
+    """Throw away every feed's snapshot, returning the new generation they'll be rebuilt under"""
+    generation = uuid.uuid4().hex
+    feed_cache.set(GENERATION_KEY, generation, _cache_timeout())
+    return generation
+
+
+class SnapshotFeed(Feed):
+    """A feed whose items are kept in a cached snapshot, topped up as new objects arrive
+
+    Subclasses provide get_queryset(), returning the objects for the feed, and item_to_dict(), which captures all an
+    item needs for the feed (pk, title, link, description, author, timestamp and categories)
+    """
+    feed_type = Atom1Feed
+
+    def get_object(self, request, slug=None):
+        tag = get_object_or_404(Tag, slug=slug) if slug is not None else None
+        return {'tag': tag, 'items': self.get_snapshot(request, tag)}
+
+    def get_queryset(self, tag):
+        raise NotImplementedError()
+
+    def item_to_dict(self, obj):
+        raise NotImplementedError()
+
+    def prefetch(self, objects):
+        prefetch_tags(objects)
+
+    def get_snapshot(self, request, tag):
+        latest_pk = get_latest(request)['pk']
+        key = 'pulse-feed:%s' % hashlib.md5('%s|%s' % (self.__class__.__name__, tag and tag.pk)).hexdigest()
+        cached = feed_cache.get_many([key, GENERATION_KEY])
+        generation = cached.get(GENERATION_KEY) or invalidate_snapshots()
+        snapshot = cached.get(key)
+        if snapshot is not None and snapshot['generation'] != generation:
+            snapshot = None
+        if snapshot is not None and snapshot['latest_pk'] == latest_pk:
+            return snapshot['items']
+
+        size = getattr(settings, 'PULSE_FEED_SIZE', 50)
+        queryset = self.get_queryset(tag)
+        items = {}
+        max_pk = None
+        if snapshot is not None and snapshot['max_pk'] is not None:
+            items = dict((item['pk'], item) for item in snapshot['items'])
+            max_pk = snapshot['max_pk']
+            queryset = queryset.filter(pk__gt=max_pk)
+        objects = list(queryset.order_by('-timestamp', '-pk')[:size])
+        self.prefetch(objects)
+        for obj in objects:
+            items[obj.pk] = self.item_to_dict(obj)
+            max_pk = max(max_pk, obj.pk)
+
+        items = sorted(items.values(), key=lambda item: (item['timestamp'], item['pk']), reverse=True)[:size]
+        feed_cache.set(key, {'generation': generation, 'latest_pk': latest_pk, 'max_pk': max_pk, 'items': items},
+                       _cache_timeout())
+        return items
+
+    def items(self, obj):
+        return obj['items']
+
+    def item_title(self, item):
+        return item['title']
+
+    def item_link(self, item):
+        return item['link']
+
+    def item_description(self, item):
+        return item['description']
+
+    def item_author_name(self, item):
+        return item['author']
+
+    def item_pubdate(self, item):
+        return item['timestamp']
+
+    def item_categories(self, item):
+        return item['categories']
+
+
+class BlipSetFeed(SnapshotFeed):
+    def title(self, obj):
+        if obj['tag'] is None:
+            return u"Pulse timeline"
+        return u"Pulse updates tagged %s" % obj['tag']
+
+    def link(self, obj):
+        if obj['tag'] is None:
+            return reverse('timeline')
+        return reverse('blipset_tags', args=[obj['tag'].slug])
+
+    def get_queryset(self, tag):
+        queryset = BlipSet.objects.select_related('provider')
+        if tag is not None:
+            queryset = queryset.filter(tags__in=[tag])
+        return queryset
+
+    def prefetch(self, objects):
+        prefetch_blipsets(objects)
+
+    def item_to_dict(self, blipset):
+        return {
+            'pk': blipset.pk,
+            'title': unicode(blipset),
+            'link': blipset.get_absolute_url(),
+            'description': render_to_string('pulse/feeds/blipset_description.html', {'blipset': blipset}),
+            'author': u", ".join(blipset.author_list) or None,
+            'timestamp': blipset.timestamp,
+            'categories': [t.name for t in blipset.tag_list],
+        }
+
+
+class BlipFeed(SnapshotFeed):
+    def title(self, obj):
+        return u"Pulse items tagged %s" % obj['tag']
+
+    def link(self, obj):
+        return reverse('blip_tags', args=[obj['tag'].slug])
+
+    def get_queryset(self, tag):
+        return Blip.objects.filter(tags__in=[tag])
+
+    def item_to_dict(self, blip):
+        return {
+            'pk': blip.pk,
+            'title': blip.title,
+            'link': blip.get_absolute_url(),
+            'description': blip.summary or u'',
+            'author': blip.who,
+            'timestamp': blip.timestamp,
+            'categories': [t.name for t in blip.tag_list],
+        }
+
+
+def item_changed(sender, **kwargs):
+    """Something that may already be in a snapshot has changed
+
+    New blipsets are merged into the snapshots as they are, but a blip or tag added to an existing blipset changes what
+    it looks like, or which tag feeds it belongs in
+    """
+    if sender is BlipSet and kwargs.get('created'):
+        return
+    invalidate_snapshots()
+for sender in (BlipSet, Blip, TaggedItem):
+    signals.post_save.connect(item_changed, sender=sender)
+    signals.post_delete.connect(item_changed, sender=sender)
+# deleting a provider rewrites its blipsets' summaries (see pulse.models.prerender_blipsets)
+signals.post_delete.connect(item_changed, sender=Provider)
+
+
+def conditional(feed):
+    """Wrap a feed so that it answers conditional GETs without building anything"""
+    return condition(etag_func=latest_etag, last_modified_func=latest_modified)(feed)
+
+
+blipset_feed = conditional(BlipSetFeed())
+blip_feed = conditional(BlipFeed())
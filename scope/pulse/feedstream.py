@@ -0,0 +1,154 @@
+"""Incremental RSS/Atom parsing
+
+feedparser builds the whole document in memory before handing anything back, which for multi-megabyte feeds means a
+lot of memory, and a lot of parsing of entries we're only going to throw away.  EntryStream parses with iterparse
+instead, handing back each entry as soon as its closing tag turns up and discarding its elements straight afterwards.
+
+Entries come back as feedparser FeedParserDicts filled in with the keys our providers use (title, link, summary,
+updated_parsed, id, tags, author, author_detail), with the HTML sanitized the same way feedparser does it.  Anything
+that isn't well-formed XML raises a SyntaxError (ParseError), in which case callers should fall back on feedparser,
+which copes with just about anything
+"""
+import re
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+import feedparser
+from feedparser import FeedParserDict
+
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+RSS10_NS = 'http://purl.org/rss/1.0/'
+DC_NS = 'http://purl.org/dc/elements/1.1/'
+CONTENT_NS = 'http://purl.org/rss/1.0/modules/content/'
+
+ENTRY_TAGS = ('item', '{%s}item' % RSS10_NS, '{%s}entry' % ATOM_NS)
+FEED_TITLE_TAGS = {
+    'channel': 'title',
+    '{%s}channel' % RSS10_NS: '{%s}title' % RSS10_NS,
+    '{%s}feed' % ATOM_NS: '{%s}title' % ATOM_NS,
+}
+
+_EMAIL_RE = re.compile(r'[\w.+-]+@(?:[\w-]+\.)+[a-zA-Z]{2,}')
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _text(elem):
+    return unicode(elem.text or u'').strip()
+
+
+# feedparser doesn't make its date parsing and HTML sanitizing public, so these two are the only places reaching into
+# its internals; they're there in the version pinned in requirements.txt (5.1), and need checking on any upgrade
+
+
+def parse_date(text):
+    """A date in any of the formats feedparser understands, as a UTC time.struct_time (or None)"""
+    return feedparser._parse_date(text)
+
+
+def sanitize_html(html):
+    """HTML cleaned up the same way feedparser does it for entry content"""
+    return feedparser._sanitizeHTML(html, 'utf-8', u'text/html')
+
+
+def _parse_author(entry, author):
+    # split out an email address the same way feedparser does, e.g. "John Doe <jdoe@example.com>"
+    entry['author'] = author
+    detail = FeedParserDict()
+    match = _EMAIL_RE.search(author)
+    if match:
+        detail['email'] = match.group(0)
+        author = author.replace(match.group(0), '').replace('()', '').replace('<>', '').strip()
+        if author.startswith('(') and author.endswith(')'):
+            author = author[1:-1].strip()
+    if author:
+        detail['name'] = author
+    entry['author_detail'] = detail
+
+
+def _build_entry(elem):
+    entry = FeedParserDict()
+    entry['tags'] = []
+    entry['links'] = []
+    for child in elem:
+        if not isinstance(child.tag, basestring):
+            continue    # comments, processing instructions
+        name = _local_name(child.tag)
+        ns = child.tag[1:].split('}')[0] if child.tag.startswith('{') else ''
+
+        if name == 'title':
+            entry['title'] = _text(child)
+        elif name == 'link':
+            href = child.get('href')
+            if href is None:                            # RSS
+                entry['link'] = _text(child)
+            else:                                       # Atom
+                rel = child.get('rel', 'alternate')
+                entry['links'].append(FeedParserDict(rel=rel, href=href, type=child.get('type')))
+                if rel == 'alternate' and 'link' not in entry:
+                    entry['link'] = href
+        elif name in ('description', 'summary') and 'summary' not in entry:
+            plain = ns != ATOM_NS or child.get('type') in (None, 'text', 'html')
+            entry['summary'] = sanitize_html(_text(child) if plain else ElementTree.tostring(child))
+        elif name in ('encoded', 'content') and ns in (CONTENT_NS, ATOM_NS):
+            entry['content'] = [FeedParserDict(value=sanitize_html(_text(child)), type=u'text/html')]
+        elif name in ('pubDate', 'updated', 'modified') or (name == 'date' and ns == DC_NS):
+            entry['updated'] = _text(child)
+            entry['updated_parsed'] = parse_date(entry['updated'])
+        elif name == 'published' and 'updated' not in entry:
+            entry['published'] = _text(child)
+            entry['published_parsed'] = parse_date(entry['published'])
+        elif name in ('guid', 'id'):
+            entry['id'] = _text(child)
+        elif name == 'category' or (name == 'subject' and ns == DC_NS):
+            term = child.get('term') or _text(child)
+            entry['tags'].append(FeedParserDict(term=term, scheme=child.get('scheme') or child.get('domain'),
+                                                label=child.get('label')))
+        elif name == 'creator' and ns == DC_NS or name == 'author' and ns != ATOM_NS:
+            _parse_author(entry, _text(child))
+        elif name == 'author':
+            for author_child in child:
+                if _local_name(author_child.tag) == 'name':
+                    _parse_author(entry, _text(author_child))
+
+    if 'updated' not in entry and 'published' in entry:
+        entry['updated'] = entry['published']
+        entry['updated_parsed'] = entry['published_parsed']
+    if 'summary' not in entry and 'content' in entry:
+        entry['summary'] = entry['content'][0]['value']
+    return entry
+
+
+class EntryStream(object):
+    """Iterates over the entries of an RSS (0.9x/1.0/2.0) or Atom feed read from a file-like object
+
+    ``feed`` picks up the feed's title as soon as it's been seen, which is before the first entry in any sane feed
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.feed = FeedParserDict()
+
+    def __iter__(self):
+        # keep track of the open elements so that finished entries can be detached from their parent, otherwise the
+        # whole document would build up underneath the root anyway
+        stack = []
+        for event, elem in ElementTree.iterparse(self.source, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                continue
+
+            stack.pop()
+            if elem.tag in ENTRY_TAGS:
+                yield _build_entry(elem)
+                if stack:
+                    stack[-1].remove(elem)
+                elem.clear()
+            elif stack and FEED_TITLE_TAGS.get(stack[-1].tag) == elem.tag and 'title' not in self.feed:
+                self.feed['title'] = _text(elem)
@@ -0,0 +1,262 @@
+"""Fetching for the providers, over keep-alive connections shared between them
+
+Most providers point at one of a handful of hosts, so rather than each fetch setting up (and tearing down) its own TCP
+and TLS connection, a Session keeps the connections to each host open in a pool and hands them out again for the next
+request.  Each host also gets a cap on how many requests can be in flight to it at once, so running updates in parallel
+doesn't hammer any one server.  Use get_session() for the session shared by the whole process, configured by the
+PULSE_FETCH_TIMEOUT and PULSE_FETCH_MAX_PER_HOST settings.
+
+Local files (``file://`` URLs or plain paths) are read directly, as feedparser always allowed, but only when that's
+the URL asked for: redirects are only followed to other http(s) URLs
+"""
+import base64
+import httplib
+import logging
+import os
+import socket
+import threading
+import urllib
+import urlparse
+import zlib
+from email.utils import formatdate
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+USER_AGENT = 'scope-pulse'
+# compressed bodies are read off the connection in chunks of this size
+DECOMPRESS_CHUNK_SIZE = 16 * 1024
+
+
+class FetchError(IOError):
+    """Raised for anything that stops a fetch from completing, including responses other than 2xx or 304"""
+
+    def __init__(self, url, message, status=None):
+        super(FetchError, self).__init__("Fetching %s failed: %s" % (url, message))
+        self.url = url
+        self.status = status
+
+
+class DecompressingReader(object):
+    """Reads a gzip or deflate encoded body, handing back the decompressed bytes"""
+
+    def __init__(self, raw, encoding):
+        self.raw = raw
+        self.gzip = encoding == 'gzip'
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if self.gzip else zlib.MAX_WBITS)
+        self._started = False
+        self._buffer = ''
+        self._eof = False
+
+    def _decompress(self, chunk):
+        try:
+            return self._decompressor.decompress(chunk)
+        except zlib.error:
+            if self.gzip or self._started:
+                raise
+            # plenty of servers send raw deflate data without the zlib wrapper
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(chunk)
+        finally:
+            self._started = True
+
+    def read(self, amt=None):
+        while not self._eof and (amt is None or len(self._buffer) < amt):
+            chunk = self.raw.read(DECOMPRESS_CHUNK_SIZE)
+            if chunk:
+                self._buffer += self._decompress(chunk)
+            else:
+                self._buffer += self._decompressor.flush()
+                self._eof = True
+        if amt is None:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+
+class Response(object):
+    """The status, headers (keyed by lower-case name) and body of a fetch
+
+    The body can be read in chunks, already decompressed if the server gzipped it; close the response once done with it, which returns its connection to the pool
+    """
+
+    def __init__(self, url, status, headers, body, on_close):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self._body = body
+        self._on_close = on_close
+
+    def read(self, amt=None):
+        try:
+            return self._body.read() if amt is None else self._body.read(amt)
+        except (httplib.HTTPException, zlib.error) as e:
+            raise FetchError(self.url, repr(e), self.status)
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+
+class HostPool(object):
+    """Keep-alive connections to a single host, with at most ``max_connections`` of them in use at a time"""
+
+    def __init__(self, scheme, host, max_connections, timeout):
+        self.scheme = scheme
+        self.host = host
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        connection_class = httplib.HTTPSConnection if self.scheme == 'https' else httplib.HTTPConnection
+        return connection_class(self.host, timeout=self.timeout)     # httplib splits off any port itself
+
+    def _exchange(self, connection, path, headers):
+        connection.request('GET', path, headers=headers)
+        return connection.getresponse()
+
+    def request(self, path, headers):
+        """Send a GET, returning the httplib response and a function to call with it once it's been dealt with"""
+        self._slots.acquire()
+        try:
+            response, connection = self._send(path, headers)
+        except:
+            self._slots.release()
+            raise
+
+        def release():
+            if response.length == 0:
+                response.read()     # nothing to read, but lets httplib mark the response as complete
+            if response.isclosed() and not response.will_close:
+                with self._lock:
+                    self._idle.append(connection)
+            else:
+                connection.close()
+            self._slots.release()
+        return response, release
+
+    def _send(self, path, headers):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is not None:
+            try:
+                return self._exchange(connection, path, headers), connection
+            except socket.timeout:
+                connection.close()
+                raise
+            except (httplib.HTTPException, socket.error):
+                # the server gave up on the idle connection in the meantime, so start afresh
+                logger.debug("Reconnecting to %s", self.host)
+                connection.close()
+
+        connection = self._new_connection()
+        try:
+            return self._exchange(connection, path, headers), connection
+        except:
+            connection.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class Session(object):
+    """Fetches URLs over pooled connections, following redirects; safe to share between threads"""
+
+    def __init__(self, timeout=None, max_per_host=4):
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, scheme, host):
+        with self._lock:
+            if (scheme, host) not in self._pools:
+                self._pools[scheme, host] = HostPool(scheme, host, self.max_per_host, self.timeout)
+            return self._pools[scheme, host]
+
+    def get(self, url, headers=None):
+        """Fetch the URL, returning a Response with status 2xx or 304 or else raising a FetchError"""
+        headers = headers or {}
+
+        for redirects in xrange(MAX_REDIRECTS + 1):
+            parts = urlparse.urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                if redirects:
+                    # a remote server mustn't be able to point us at local files (or anything else)
+                    raise FetchError(url, "refusing to follow a redirect to scheme %r" % parts.scheme)
+                if parts.scheme in ('', 'file'):
+                    return self._open_file(url, parts)
+                raise FetchError(url, "unsupported scheme %r" % parts.scheme)
+
+            host = parts.netloc.rpartition('@')[2]
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            request_headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'}
+            if parts.username is not None:
+                # credentials in the URL, as feedparser supported
+                credentials = '%s:%s' % (urllib.unquote(parts.username), urllib.unquote(parts.password or ''))
+                request_headers['Authorization'] = 'Basic ' + base64.b64encode(credentials)
+            request_headers.update(headers)
+            try:
+                response, release = self._pool(parts.scheme, host).request(path, request_headers)
+            except httplib.HTTPException as e:
+                raise FetchError(url, repr(e))
+
+            location = response.getheader('location')
+            if response.status in REDIRECT_STATUSES and location:
+                response.read()
+                release()
+                url = urlparse.urljoin(url, location)
+                continue
+
+            body = response
+            encoding = (response.getheader('content-encoding') or '').strip().lower()
+            if encoding in ('gzip', 'x-gzip', 'deflate'):
+                body = DecompressingReader(response, 'deflate' if encoding == 'deflate' else 'gzip')
+            result = Response(url, response.status, dict(response.getheaders()), body, release)
+            if response.status == 304 or 200 <= response.status < 300:
+                return result
+            result.close()
+            raise FetchError(url, "%d %s" % (response.status, response.reason), response.status)
+
+        raise FetchError(url, "too many redirects")
+
+    def _open_file(self, url, parts):
+        path = urllib.url2pathname(parts.path) if parts.scheme else url
+        f = open(path, 'rb')
+        headers = {'last-modified': formatdate(os.fstat(f.fileno()).st_mtime, usegmt=True)}
+        return Response(url, 200, headers, f, f.close)
+
+    def close(self):
+        """Close all of the idle connections"""
+        with self._lock:
+            pools = self._pools.values()
+        for pool in pools:
+            pool.close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The Session shared by every provider in this process"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = Session(timeout=getattr(settings, 'PULSE_FETCH_TIMEOUT', 30),
+                               max_per_host=getattr(settings, 'PULSE_FETCH_MAX_PER_HOST', 4))
+        return _session
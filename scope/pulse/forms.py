@@ -11,6 +11,10 @@ class TagFilterForm(BootstrapForm):
                                           required=False)
 
 
+class SearchForm(BootstrapForm):
+    q = forms.CharField(required=True, max_length=255, label=u"Search for")
+
+
 class PasswordModelForm(forms.ModelForm):
     """Simple form to shield a password field"""
     class Meta:
@@ -0,0 +1,11 @@
+from django.db.models import signals
+
+from pulse import models as pulse_models
+from pulse.search import create_index
+
+
+def create_search_index(sender, **kwargs):
+    """Add the full-text search table alongside the models' tables"""
+    if create_index() and kwargs.get('verbosity', 1) > 0:
+        print "Creating search index"
+signals.post_syncdb.connect(create_search_index, sender=pulse_models)
@@ -0,0 +1,21 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pulse.archive import ARCHIVE_BATCH_SIZE, archive_expired
+
+
+class Command(BaseCommand):
+    help = 'Move blipsets past their retention period, with their blips and tags, into the archive'
+    args = ''
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=ARCHIVE_BATCH_SIZE,
+                    help='Number of blipsets to archive in each transaction (default: %d)' % ARCHIVE_BATCH_SIZE),
+    )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        blipsets, blips = archive_expired(options['batch_size'])
+        if int(options['verbosity']) > 0:
+            self.stdout.write("Archived %d blipsets and %d blips\n" % (blipsets, blips))
@@ -0,0 +1,35 @@
+import logging
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pulse.models import Blip, BlipSet, join_authors
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the blip count and authors stored on every BlipSet'
+    args = ''
+
+    def handle(self, *args, **options):
+        blipset_ids = list(BlipSet.objects.order_by('pk').values_list('pk', flat=True))
+        for i in xrange(0, len(blipset_ids), CHUNK_SIZE):
+            chunk = blipset_ids[i:i + CHUNK_SIZE]
+            counts = defaultdict(int)
+            whos = defaultdict(list)
+            for blipset_id, who in Blip.objects.filter(blipset__in=chunk).values_list('blipset', 'who'):
+                counts[blipset_id] += 1
+                whos[blipset_id].append(who)
+            with transaction.commit_on_success():
+                for blipset_id in chunk:
+                    BlipSet.objects.filter(pk=blipset_id).update(blip_count=counts[blipset_id],
+                                                                 authors=join_authors(whos[blipset_id]))
+            logger.debug("Backfilled blipsets %d-%d", chunk[0], chunk[-1])
+
+        if int(options['verbosity']) > 0:
+            self.stdout.write("Backfilled %d blipsets\n" % len(blipset_ids))
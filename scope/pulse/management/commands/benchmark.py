@@ -0,0 +1,64 @@
+import json
+import platform
+import shutil
+import sys
+import tempfile
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.timezone import now
+
+from pulse import bench
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the ingest and timeline paths against synthetic data in a throwaway test database'
+    args = ''
+    option_list = BaseCommand.option_list + (
+        make_option('--providers', type='int', dest='providers', default=6,
+                    help='Number of providers, split between Trac, plain RSS and filesystem (default: 6)'),
+        make_option('--entries', type='int', dest='entries', default=500,
+                    help='Entries in each generated feed (default: 500)'),
+        make_option('--log-lines', type='int', dest='log_lines', default=5000,
+                    help='Lines in each generated change log (default: 5000)'),
+        make_option('--blipsets', type='int', dest='blipsets', default=1000,
+                    help='Blipsets to fill the timeline with (default: 1000)'),
+        make_option('--blips', type='int', dest='blips', default=5000,
+                    help='Blips spread across those blipsets (default: 5000)'),
+        make_option('--repeat', type='int', dest='repeat', default=3,
+                    help='Times to render the timeline, both cold and warm (default: 3)'),
+        make_option('--seed', type='int', dest='seed', default=0,
+                    help='Random seed for the synthetic data (default: 0)'),
+        make_option('--output', dest='output', default=None,
+                    help='Write the JSON results to this file rather than stdout'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        params = dict((key, options[key]) for key in ('providers', 'entries', 'log_lines', 'blipsets', 'blips',
+                                                      'repeat', 'seed'))
+
+        # everything happens in a test database, so the real data is never touched
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=max(verbosity - 1, 0))
+        directory = tempfile.mkdtemp()
+        try:
+            results = bench.run(directory, **params)
+        finally:
+            shutil.rmtree(directory)
+            connection.creation.destroy_test_db(old_name, verbosity=max(verbosity - 1, 0))
+
+        report = {
+            'started': now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'params': params,
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            self.stdout.write("\n")
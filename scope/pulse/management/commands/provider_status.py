@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pulse.status import all_provider_status
+
+
+def format_seconds(value):
+    return '-' if value is None else '%.2fs' % value
+
+
+class Command(BaseCommand):
+    help = 'Show how the recent updates of each provider went'
+    args = ''
+
+    def handle(self, *args, **options):
+        for status in all_provider_status():
+            provider = status['provider']
+            self.stdout.write(u"%s %s: %d runs (%d failed), p50 %s, p95 %s, %d bytes, %d entries, %d blips\n" % (
+                provider.__class__.__name__, provider, status['runs'], status['failures'],
+                format_seconds(status['p50']), format_seconds(status['p95']), status['bytes_downloaded'],
+                status['entries_seen'], status['blips_created']))
+            if status['staleness'] is not None:
+                self.stdout.write("    last updated %.1f update periods ago, last new content at %s\n" % (
+                    status['staleness'], status['last_new_content']))
+            if status['last_error'] is not None:
+                self.stdout.write(u"    last error at %s: %s\n" % (status['last_error'].started,
+                                                                  status['last_error'].error))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pulse.models import Blip
+from pulse.search import INDEX_BATCH_SIZE, clear_index, create_index, get_backend, index_blips
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the blips from scratch'
+    args = ''
+
+    def handle(self, *args, **options):
+        if get_backend() is None:
+            raise CommandError("Full-text search isn't supported on this database")
+
+        with transaction.commit_on_success():
+            if not create_index():
+                clear_index()
+            pks = list(Blip.objects.order_by('pk').values_list('pk', flat=True))
+            for i in xrange(0, len(pks), INDEX_BATCH_SIZE):
+                index_blips(pks[i:i + INDEX_BATCH_SIZE])
+
+        if int(options['verbosity']) > 0:
+            self.stdout.write("Indexed %d blips\n" % len(pks))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from taggit.models import TaggedItem
+
+from pulse.models import BULK_CREATE_BATCH_SIZE, TagCount
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the tag counts used by the tag clouds from scratch'
+    args = ''
+
+    def handle(self, *args, **options):
+        rows = TaggedItem.objects.values('content_type', 'tag').annotate(count=Count('pk')).order_by()
+        counts = [TagCount(content_type_id=row['content_type'], tag_id=row['tag'], count=row['count']) for row in rows]
+        with transaction.commit_on_success():
+            TagCount.objects.all().delete()
+            for i in xrange(0, len(counts), BULK_CREATE_BATCH_SIZE):
+                TagCount.objects.bulk_create(counts[i:i + BULK_CREATE_BATCH_SIZE])
+
+        if int(options['verbosity']) > 0:
+            self.stdout.write("Rebuilt %d tag counts\n" % len(counts))
@@ -0,0 +1,32 @@
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pulse.scheduler import Scheduler
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Keep updating the providers as they come due, instead of running update_providers from cron'
+    args = ''
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=1,
+                    help='Number of providers to update in parallel (default: 1)'),
+        make_option('--refresh', type='int', dest='refresh', default=60,
+                    help='How often to reload the providers to pick up changes, in seconds (default: 60)'),
+    )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options['refresh'] < 1:
+            raise CommandError("--refresh must be at least 1")
+
+        logger.info("Starting scheduler with %d worker(s)", options['workers'])
+        try:
+            Scheduler(workers=options['workers'], refresh_interval=options['refresh']).run_forever()
+        except KeyboardInterrupt:
+            logger.info("Scheduler stopped")
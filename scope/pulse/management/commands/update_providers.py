@@ -1,7 +1,10 @@
 import logging
+import time
+from optparse import make_option
 
 from django.core.management.base import BaseCommand, CommandError
 
+from pulse.engine import run_pipeline, update_providers
 from pulse.models import Provider
 
 
@@ -11,8 +14,40 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Update the various providers'
     args = ''
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=1,
+                    help='Number of providers to update in parallel (default: 1)'),
+        make_option('--fetch-workers', type='int', dest='fetch_workers', default=0,
+                    help='Fetch up to this many providers at once, leaving --workers threads to parse and save them '
+                         '(default: 0, fetch and save each provider in turn)'),
+    )
 
     def handle(self, *args, **options):
-        for p in Provider.objects.all():
-            logger.debug("Updating %s %s..." % (p.__class__.__name__, p))
-            p.update()
\ No newline at end of file
+        workers = options['workers']
+        fetch_workers = options['fetch_workers']
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+        if fetch_workers < 0:
+            raise CommandError("--fetch-workers can't be negative")
+        verbosity = int(options['verbosity'])
+
+        start = time.time()
+        if fetch_workers:
+            results = run_pipeline(Provider.objects.all(), fetch_workers=fetch_workers, workers=workers)
+        else:
+            results = update_providers(Provider.objects.all(), workers=workers)
+        elapsed = time.time() - start
+
+        for result in results:
+            logger.info(result.__unicode__())
+            if verbosity > 1:
+                self.stdout.write("%s\n" % result.__unicode__())
+
+        failures = [r for r in results if r.error]
+        summary = "Updated %d providers (%d failed) in %.2fs using %d worker(s)" % (len(results), len(failures),
+                                                                                  elapsed, workers)
+        logger.info(summary)
+        if verbosity > 0:
+            self.stdout.write("%s\n" % summary)
+        if failures:
+            raise CommandError("Failed to update: %s" % ", ".join(unicode(r.provider) for r in failures))
@@ -0,0 +1,110 @@
+"""Lightweight request profiling that's safe to leave on in production
+
+ProfilingMiddleware samples a fraction (PULSE_PROFILE_RATE) of the requests, recording for each one its SQL query
+count, time spent in the database, time spent rendering templates and overall latency, and adds them up per URL name
+(``timeline``, ``blipset_detail``, ...).  Each sample is logged to the ``pulse.profile`` logger, and the totals can be
+read as JSON from the staff-only pulse.views.profile view.  With the rate left at 0 the middleware takes itself out of
+the chain when Django loads it, so it costs nothing.
+
+Template time is only seen for views returning a TemplateResponse (the class-based views do); for the rest it's 0 and
+counts towards the view's time instead
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import connection
+
+
+logger = logging.getLogger('pulse.profile')
+
+STATS = ('queries', 'db_time', 'template_time', 'latency')
+
+
+class ProfileStore(object):
+    """Totals of the sampled requests' stats, per URL name, shared by all of the process's threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def add(self, url_name, sample):
+        with self.lock:
+            totals = self.totals.setdefault(url_name, dict([('requests', 0), ('max_latency', 0.0)] +
+                                                           [(stat, 0) for stat in STATS]))
+            totals['requests'] += 1
+            totals['max_latency'] = max(totals['max_latency'], sample['latency'])
+            for stat in STATS:
+                totals[stat] += sample[stat]
+
+    def summary(self):
+        """The totals for each URL name, along with the average of each stat per request"""
+        with self.lock:
+            summary = {}
+            for url_name, totals in self.totals.items():
+                summary[url_name] = dict(totals)
+                for stat in STATS:
+                    summary[url_name]['mean_%s' % stat] = totals[stat] / float(totals['requests'])
+            return summary
+
+    def clear(self):
+        with self.lock:
+            self.totals = {}
+
+profiles = ProfileStore()
+
+
+def get_url_name(request):
+    try:
+        return resolve(request.path_info).url_name or 'unnamed'
+    except Resolver404:
+        return 'unresolved'
+
+
+class ProfilingMiddleware(object):
+    def __init__(self):
+        self.rate = getattr(settings, 'PULSE_PROFILE_RATE', 0)
+        if not self.rate:
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        if random.random() >= self.rate:
+            return
+        request.pulse_profile = {
+            'start': time.time(),
+            'first_query': len(connection.queries),
+            'debug_cursor': connection.use_debug_cursor,
+            'template_time': 0.0,
+        }
+        connection.use_debug_cursor = True
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, 'pulse_profile', None)
+        if profile is not None:
+            # rendering happens once all the template response middleware is done, so time it from here
+            render_start = time.time()
+            response.add_post_render_callback(lambda r: profile.update(template_time=time.time() - render_start))
+        return response
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'pulse_profile', None)
+        if profile is None:
+            return response
+        del request.pulse_profile
+        queries = connection.queries[profile['first_query']:]
+        connection.use_debug_cursor = profile['debug_cursor']
+        sample = {
+            'queries': len(queries),
+            'db_time': sum(float(query['time']) for query in queries),
+            'template_time': profile['template_time'],
+            'latency': time.time() - profile['start'],
+        }
+        url_name = get_url_name(request)
+        profiles.add(url_name, sample)
+        logger.info("%s %s: %d queries, %.3fs in the database, %.3fs rendering, %.3fs in all", url_name, request.path,
+                    sample['queries'], sample['db_time'], sample['template_time'], sample['latency'])
+        return response
@@ -1,26 +1,60 @@
 import datetime
+import hashlib
+import json
 import logging
 import os
 import re
+import tempfile
 import time
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
 
 import feedparser
-from django.db import models
-from django.db.models import signals
-from django.utils.timezone import get_default_timezone, now, utc
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, signals
+from django.utils.timezone import get_current_timezone, get_default_timezone, now, utc
 from taggit.managers import TaggableManager
+from taggit.models import Tag, TaggedItem
 
 from polymorphic import PolymorphicModel
 
+from pulse.feedstream import EntryStream, parse_date
+from pulse.fetch import get_session
+from pulse.search import index_blips, unindex_blips
+
 
 logger = logging.getLogger(__name__)
 
+# keeps bulk inserts under the bound-parameter limits of the various DB backends (SQLite in particular)
+BULK_CREATE_BATCH_SIZE = 100
+# likewise for the number of values in a single `IN (...)` lookup
+LOOKUP_BATCH_SIZE = 500
+# feeds are read in chunks of this size and kept in memory up to FEED_SPOOL_SIZE, beyond which they're spooled to disk
+FEED_CHUNK_SIZE = 64 * 1024
+FEED_SPOOL_SIZE = 1024 * 1024
+
+
+class PrefetchedTagsMixin(object):
+    """Gives a tagged model a ``tag_list``, which prefetch_tags() can fill in for a whole page of objects at once"""
+
+    @property
+    def tag_list(self):
+        if not hasattr(self, '_tag_list_cache'):
+            self._tag_list_cache = list(self.tags.all())
+        return self._tag_list_cache
 
-class BlipSet(models.Model):
+
+class BlipSet(PrefetchedTagsMixin, models.Model):
     timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
     tags = TaggableManager(blank=True)
     provider = models.ForeignKey('Provider', null=True, editable=False, on_delete=models.SET_NULL, related_name='blip_sets')
     summary = models.TextField(editable=False, null=True)
+    # denormalized from the blips, so rendering a blipset doesn't have to go back to them.  Kept up to date when
+    # blips are saved/deleted (see update_blip_stats) and filled in directly by the bulk ingest in Provider.update
+    blip_count = models.PositiveIntegerField(default=0, editable=False)
+    authors = models.TextField(blank=True, editable=False, help_text=u"Unique blip authors, one per line")
     class Meta:
         ordering = ['-timestamp']
 
@@ -32,7 +66,7 @@ class BlipSet(models.Model):
         # message that gets stored with the blipset
         # Note: if you edit this, make sure you update the help text for Provider.summary_format
         summary_args = {
-            'count' : self.blips.count(),
+            'count' : self.blip_count,
             'source' : self.provider.name,
         }
         return self.provider.summary_format % summary_args
@@ -41,12 +75,27 @@ class BlipSet(models.Model):
     def get_absolute_url(self):
         return 'blipset_detail', [str(self.pk)]
 
-    def authors(self):
+    @property
+    def blip_list(self):
+        """All of the blips in the blipset, using the ones loaded by prefetch_blipsets() if available"""
+        if not hasattr(self, '_blip_list_cache'):
+            self._blip_list_cache = list(self.blips.all())
+        return self._blip_list_cache
+
+    @property
+    def author_list(self):
         """Return all of the unique authors in the blipset"""
-        return sorted(set([b.who for b in self.blips.all() if b.who]))
+        return self.authors.splitlines()
+
+    def update_blip_stats(self):
+        """Recalculate blip_count and authors from the blips, saving just those two fields"""
+        whos = list(self.blips.values_list('who', flat=True))
+        self.blip_count = len(whos)
+        self.authors = join_authors(whos)
+        BlipSet.objects.filter(pk=self.pk).update(blip_count=self.blip_count, authors=self.authors)
 
 
-class Blip(models.Model):
+class Blip(PrefetchedTagsMixin, models.Model):
     source_url = models.URLField()
     title = models.TextField()
     summary = models.TextField(null=True)
@@ -54,6 +103,8 @@ class Blip(models.Model):
     timestamp = models.DateTimeField(db_index=True)
     tags = TaggableManager(blank=True)
     blipset = models.ForeignKey(BlipSet, related_name='blips', null=True)
+    # identifies the entry this blip was imported from (see Provider.make_ingest_key), so it's never imported twice
+    ingest_key = models.CharField(max_length=40, unique=True, null=True, editable=False)
     class Meta:
         ordering = ['-timestamp']
 
@@ -74,14 +125,118 @@ class Blip(models.Model):
                     self.tags.add(m.group(1))
 
 
+def restore_tags(tags):
+    """Unsaved Tags from the ``[name, slug]`` pairs stored in an archived object's data"""
+    return [Tag(name=name, slug=slug) for name, slug in tags]
+
+
+class ArchivedBlipSet(models.Model):
+    """A blipset moved out of the timeline by the retention policy (see pulse.archive), under its original pk
+
+    ``data`` holds everything else needed to show it, as JSON: the rendered summary, blip_count, authors and tags
+    """
+    id = models.IntegerField(primary_key=True)
+    timestamp = models.DateTimeField(db_index=True)
+    provider = models.ForeignKey('Provider', null=True, on_delete=models.SET_NULL, related_name='archived_blip_sets')
+    archived = models.DateTimeField(auto_now_add=True)
+    data = models.TextField()
+    class Meta:
+        ordering = ['-timestamp']
+
+    def __unicode__(self):
+        return json.loads(self.data)['summary']
+
+    def restore(self, with_blips=True):
+        """An unsaved BlipSet with the blips and tags it had, for showing on the detail pages"""
+        data = json.loads(self.data)
+        blipset = BlipSet(pk=self.pk, timestamp=self.timestamp, provider_id=self.provider_id, summary=data['summary'],
+                          blip_count=data['blip_count'], authors=data['authors'])
+        blipset._tag_list_cache = restore_tags(data['tags'])
+        if with_blips:
+            blipset._blip_list_cache = [blip.restore(blipset) for blip in self.blips.all()]
+        return blipset
+
+
+class ArchivedBlip(models.Model):
+    """A blip archived along with its blipset, under its original pk; ``data`` holds the rest of its fields as JSON"""
+    id = models.IntegerField(primary_key=True)
+    blipset = models.ForeignKey(ArchivedBlipSet, related_name='blips', null=True)
+    timestamp = models.DateTimeField()
+    data = models.TextField()
+    class Meta:
+        ordering = ['-timestamp']
+
+    def __unicode__(self):
+        return json.loads(self.data)['title']
+
+    def restore(self, blipset=None):
+        """An unsaved Blip as it was, in the (restored) blipset"""
+        data = json.loads(self.data)
+        if blipset is None and self.blipset_id is not None:
+            blipset = self.blipset.restore(with_blips=False)
+        blip = Blip(pk=self.pk, blipset=blipset, timestamp=self.timestamp, source_url=data['source_url'],
+                    title=data['title'], summary=data['summary'], who=data['who'], ingest_key=data['ingest_key'])
+        blip._tag_list_cache = restore_tags(data['tags'])
+        return blip
+
+
+class TagCount(models.Model):
+    """How many objects of a given model carry a tag, kept up to date as tags are added and removed
+
+    Lets the tag clouds read their counts straight out of an index instead of aggregating the whole TaggedItem table
+    on every page view
+    """
+    tag = models.ForeignKey(Tag, related_name='pulse_counts')
+    content_type = models.ForeignKey(ContentType)
+    count = models.IntegerField(default=0)
+    class Meta:
+        unique_together = ('content_type', 'tag')
+
+    def __unicode__(self):
+        return u"%s on %s: %d" % (self.tag, self.content_type, self.count)
+
+
+class UpdateRun(models.Model):
+    """Timings and counts from one update of a provider, kept for the last PULSE_UPDATE_RUN_HISTORY updates of each
+
+    The fetch covers the download (or for providers that can't split their work, everything up to having the blips),
+    the parse turning it into blips and the write saving them.  Times are in seconds
+    """
+    provider = models.ForeignKey('Provider', related_name='update_runs')
+    started = models.DateTimeField(db_index=True)
+    fetch_time = models.FloatField(default=0)
+    parse_time = models.FloatField(default=0)
+    write_time = models.FloatField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    entries_seen = models.IntegerField(default=0)
+    blips_created = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    class Meta:
+        ordering = ['-started']
+
+    def __unicode__(self):
+        return u"%s at %s" % (self.provider_id, self.started)
+
+    @property
+    def duration(self):
+        return self.fetch_time + self.parse_time + self.write_time
+
+
 class Provider(PolymorphicModel):
     update_frequency = models.IntegerField(verbose_name='Update Rate (mins)')
     name = models.CharField(max_length=255, blank=True)
     last_update = models.DateTimeField(editable=False, default=datetime.datetime(year=1900, month=1, day=1, tzinfo=get_default_timezone()))
     summary_format = models.TextField(default=u"%(count)d new items fetched from %(source)s",
                                       help_text=u"String-formatting indices you can use are `count` and `source`")
+    retention_days = models.PositiveIntegerField(null=True, blank=True,
+                                                 help_text=u"Days to keep blipsets before archiving them "
+                                                           u"(blank for the PULSE_RETENTION_DAYS default)")
     tags = TaggableManager()
 
+    # fields recording how far the last fetch got (feed validators, file offsets, ...).  These get saved even when the
+    # fetch turned up nothing new, so the next fetch can pick up where this one left off
+    fetch_state_fields = ()
+
     def __unicode__(self):
         return self.name
 
@@ -91,72 +246,306 @@ class Provider(PolymorphicModel):
         Keeps track of update rates to ensure we don't pummel the end services.  Also handles tagging all blips
         that are created
         """
-        if (now() - self.last_update) < datetime.timedelta(minutes=self.update_frequency):
+        if not self.is_due():
             logger.debug("Skipping update because we updated it recently")
             return
-
-        blips = self._fetch_blips()
-        if not blips:
-            logger.debug("No new items found.")
+        self.begin_run()
+        error = None
+        try:
+            self.ingest(self.parse_blips(self.fetch_raw()))
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.end_run(error)
+
+    def begin_run(self):
+        """Start recording an UpdateRun, which fetch_raw(), parse_blips() and ingest() fill in as they go"""
+        self.current_run = UpdateRun(provider=self, started=now())
+        return self.current_run
+
+    def record(self, stat, amount):
+        """Add to one of the current UpdateRun's stats, if there is one"""
+        run = getattr(self, 'current_run', None)
+        if run is not None:
+            setattr(run, stat, getattr(run, stat) + amount)
+
+    def end_run(self, error=None):
+        """Save the current UpdateRun, trimming the provider's history down to PULSE_UPDATE_RUN_HISTORY runs"""
+        run = getattr(self, 'current_run', None)
+        if run is None:
             return
+        self.current_run = None
+        if error is not None:
+            run.error = u"%s: %s" % (error.__class__.__name__, error)
+        run.save()
+        history = getattr(settings, 'PULSE_UPDATE_RUN_HISTORY', 100)
+        cutoff = self.update_runs.order_by('-pk').values_list('pk', flat=True)[history:history + 1]
+        if cutoff:
+            UpdateRun.objects.filter(provider=self, pk__lte=cutoff[0]).delete()
+
+    def fetch_raw(self):
+        start = time.time()
+        try:
+            return self._fetch_raw()
+        finally:
+            self.record('fetch_time', time.time() - start)
 
-        blipset = BlipSet.objects.create(provider=self,
-                                         timestamp=max(blips, key=lambda b: b.timestamp),  # latest of all of the new blips
-        )
+    def parse_blips(self, raw):
+        start = time.time()
+        try:
+            blips = list(self._parse_blips(raw))
+        finally:
+            self.record('parse_time', time.time() - start)
+        run = getattr(self, 'current_run', None)
+        if run is not None and not run.entries_seen:
+            run.entries_seen = len(blips)
+        return blips
 
-        # save blips
+    def ingest(self, blips):
+        """Save whichever of the given (unsaved) blips haven't been seen before, along with the fetch state"""
+        start = time.time()
+        try:
+            blips = self._skip_known_blips(list(blips))
+            self.record('blips_created', len(blips))
+            if not blips:
+                logger.debug("No new items found.")
+                self._save_fetch_state()
+                return
+
+            blipset = self._save_blips(blips)
+            logger.debug(blipset)
+        finally:
+            self.record('write_time', time.time() - start)
+
+    def make_ingest_key(self, *identity):
+        """Build the ingest_key for an entry from this provider, given whatever uniquely identifies it at the source"""
+        identity = u'\x00'.join(unicode(part) for part in (self.pk,) + identity)
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _skip_known_blips(self, blips):
+        """Drop any blips which have already been imported (or turn up twice), looking up their ingest_keys in bulk
+
+        This is what stops duplicates when the source restamps entries, clocks disagree, or we died between saving the
+        blips and saving last_update
+        """
+        keys = [b.ingest_key for b in blips if b.ingest_key]
+        known = set()
+        for i in xrange(0, len(keys), LOOKUP_BATCH_SIZE):
+            known.update(Blip.objects.filter(ingest_key__in=keys[i:i + LOOKUP_BATCH_SIZE])
+                                     .values_list('ingest_key', flat=True))
+        new_blips = []
         for b in blips:
-            b.blipset = blipset
-            b.save()
-
-        for t in self.tags.all():
-            blipset.tags.add(t)
-            logger.debug("Tagged blipset %s with %s", blipset, t)
-
-        logger.debug(blipset)
-
-        self.last_update = now()
-        self.save()
+            if b.ingest_key:
+                if b.ingest_key in known:
+                    continue
+                known.add(b.ingest_key)
+            new_blips.append(b)
+        if len(new_blips) < len(blips):
+            logger.debug("Skipped %d blips which were already imported", len(blips) - len(new_blips))
+        return new_blips
+
+    def next_update(self):
+        """When the provider is next due for an update"""
+        return self.last_update + datetime.timedelta(minutes=self.update_frequency)
+
+    def is_due(self):
+        return now() >= self.next_update()
+
+    def _save_blips(self, blips):
+        """Create the BlipSet for the given (unsaved) blips and save it all in one transaction
+
+        The blips are inserted in bulk and all of their tags, plus this provider's tags for the blipset, are attached
+        (and the blips indexed for search) in bulk as well, so the number of queries doesn't grow with the number of
+        blips.  last_update is saved in the same transaction, so a failure part-way through leaves nothing behind to be
+        imported twice
+        """
+        with transaction.commit_on_success():
+            blipset = BlipSet.objects.create(provider=self, blip_count=len(blips),
+                                             authors=join_authors(b.who for b in blips))
+            for b in blips:
+                b.blipset = blipset
+            for i in xrange(0, len(blips), BULK_CREATE_BATCH_SIZE):
+                Blip.objects.bulk_create(blips[i:i + BULK_CREATE_BATCH_SIZE])
+            # bulk_create doesn't give us the primary keys back, but the rows were inserted in order
+            for b, pk in zip(blips, blipset.blips.order_by('pk').values_list('pk', flat=True)):
+                b.pk = pk
+            index_blips([b.pk for b in blips])
+
+            tagged = [(b, b.pending_tags) for b in blips if getattr(b, 'pending_tags', None)]
+            tagged.append((blipset, self.tags.all()))
+            bulk_add_tags(tagged)
+
+            self.last_update = now()
+            self.save()
+        return blipset
 
     def _fetch_blips(self):
         """Grab all of the blips to be created by this update
 
-        Does not save them into the database, this way we can create/update the blipset in one place
+        Does not save them into the database, this way we can create/update the blipset in one place.  Tags for a
+        blip can be given as a list of names in its ``pending_tags`` attribute, and they'll be added once it's saved
 
         Return value is an iterable containing the blips to be created during this update
         """
         raise NotImplementedError()
 
+    def _fetch_raw(self):
+        """The network half of _fetch_blips: fetch whatever _parse_blips needs, without touching the database
+
+        Providers that can split their work this way let the update pipeline (see pulse.engine) overlap the waiting on
+        many servers, while the CPU-bound parsing happens elsewhere.  Others just do all of _fetch_blips here
+        """
+        return self._fetch_blips()
+
+    def _parse_blips(self, raw):
+        """The other half of _fetch_blips, turning what _fetch_raw returned into the blips"""
+        return raw
+
+    def _save_fetch_state(self):
+        """Persist just the fetch_state_fields, leaving last_update (and everything else) alone"""
+        if self.fetch_state_fields:
+            values = dict((f, getattr(self, f)) for f in self.fetch_state_fields)
+            type(self)._default_manager.filter(pk=self.pk).update(**values)
+
 
 class RSSProvider(Provider):
     url = models.URLField()
+    # validators from the last fetch, sent back with the next one so unchanged feeds can be skipped
+    etag = models.TextField(blank=True, editable=False)
+    last_modified = models.TextField(blank=True, editable=False)
+    content_hash = models.CharField(max_length=40, blank=True, editable=False)
+    # set once a complete pass has seen the entries in reverse time order, after which parsing stops at the first old one
+    newest_first = models.BooleanField(default=False, editable=False)
+
+    # the name is standing in for the feed's title (see save), which the first fetch fills in
+    name_pending = models.BooleanField(default=False, editable=False)
+
+    fetch_state_fields = ('etag', 'last_modified', 'content_hash', 'newest_first', 'name', 'name_pending')
 
     def save(self, *args, **kwargs):
-        """Automatically populate the name field using the RSS source, if one isn't provided on creation"""
+        """Name the provider after its URL, if a name isn't provided on creation, until the feed's title turns up
+
+        Nothing is fetched here, so providers can be created in bulk (or from the admin) without waiting on the feeds
+        """
         if not self.name:
-            content = feedparser.parse(self.url)
-            try:
-                self.name = content['feed']['title']
-            except KeyError:
-                self.name = self.url
+            self.name = self.url
+            self.name_pending = True
+        elif self.name_pending and self.name != self.url:
+            self.name_pending = False       # someone's named it since
         super(RSSProvider, self).save(*args, **kwargs)
 
+    def _discover_name(self, title):
+        if self.name_pending and title:
+            self.name = title
+            self.name_pending = False
+
     def _get_timestamp(self, entry):
         """Convert the given RSS entry timestamp into a Python datetime compatible with our DB"""
         return datetime.datetime.fromtimestamp(time.mktime(entry.updated_parsed)).replace(tzinfo=utc)
 
+    def _fetch_feed(self):
+        """Download the feed over the shared connection pool, returning it as a file positioned at the start, or None
+        if it hasn't changed
+
+        The ETag/Last-Modified validators from the previous fetch are sent along so the server can answer with a 304.
+        For servers that don't support conditional requests, a hash of the body is compared instead so an identical
+        feed is never parsed twice.  The body is spooled to disk once it gets big, so even huge feeds don't have to fit
+        in memory; the caller is responsible for closing it
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        response = get_session().get(self.url, headers)
+        try:
+            if response.status == 304:
+                logger.debug("%s not modified since the last fetch", self.url)
+                return None
+            body = tempfile.SpooledTemporaryFile(max_size=FEED_SPOOL_SIZE)
+            digest = hashlib.sha1()
+            try:
+                for chunk in iter(lambda: response.read(FEED_CHUNK_SIZE), ''):
+                    digest.update(chunk)
+                    body.write(chunk)
+                    self.record('bytes_downloaded', len(chunk))
+            except:
+                body.close()
+                raise
+        finally:
+            response.close()
+        self.etag = response.headers.get('etag', '')
+        self.last_modified = response.headers.get('last-modified', '')
+
+        content_hash = digest.hexdigest()
+        if content_hash == self.content_hash:
+            logger.debug("%s is identical to the last fetch", self.url)
+            body.close()
+            return None
+        self.content_hash = content_hash
+        body.seek(0)
+        return body
+
     def _fetch_blips(self):
+        return self._parse_blips(self._fetch_raw())
+
+    def _fetch_raw(self):
+        return self._fetch_feed()
+
+    def _parse_blips(self, body):
+        if body is None:
+            return []
+        try:
+            try:
+                stream = EntryStream(body)
+                return self._collect_blips(stream, stream.feed)
+            except SyntaxError:
+                # not well-formed XML; feedparser's forgiving parser can still make something of it
+                logger.debug("%s isn't well-formed, falling back on feedparser", self.url)
+                body.seek(0)
+                content = feedparser.parse(body)
+                return self._collect_blips(content['entries'], content['feed'])
+        finally:
+            body.close()
+
+    def _collect_blips(self, entries, feed):
+        """Turn the new entries into blips, stopping early once we're into old ones if the feed is newest first
+
+        Whether the feed is newest first is only trusted once a complete pass over it has shown as much, so a feed
+        that's out of order never has entries skipped.  A pending name is taken from the feed's title as soon as it
+        turns up (ahead of the first entry when the feed is streamed), before any blips that might use it are made
+        """
         blips = []
-        content = feedparser.parse(self.url)
-        for entry in content['entries']:
+        newest_first = True
+        previous = None
+        for entry in entries:
+            self._discover_name(feed.get('title'))
+            self.record('entries_seen', 1)
             timestamp = self._get_timestamp(entry)
-            if timestamp > self.last_update:
+            if timestamp <= self.last_update:
+                if self.newest_first:
+                    break
+            else:
                 blips.append(self.create_blip(entry))
+            if previous is not None and timestamp > previous:
+                newest_first = False
+            previous = timestamp
+        self._discover_name(feed.get('title'))
+        self.newest_first = newest_first
         return blips
 
     def create_blip(self, entry):
-        return Blip.objects.create(title=entry.title, source_url=entry.link, summary=entry.summary,
-            timestamp=self._get_timestamp(entry))
+        """Build the (unsaved) Blip for a feed entry; subclasses can tweak it before it gets saved"""
+        return Blip(title=entry.title, source_url=entry.link, summary=entry.summary,
+            timestamp=self._get_timestamp(entry), ingest_key=self._entry_ingest_key(entry))
+
+    def _entry_ingest_key(self, entry):
+        """Identify the entry by its GUID, falling back on its link, or failing that its contents"""
+        identity = entry.get('id') or entry.get('link')
+        if not identity:
+            identity = u'%s\x00%s\x00%s' % (entry.get('title'), entry.get('summary'), entry.get('updated'))
+        return self.make_ingest_key(identity)
 
 
 class FlickrProvider(RSSProvider):
@@ -186,8 +575,7 @@ class KunenaProvider(RSSProvider):
 class TracTimelineProvider(RSSProvider):
     def create_blip(self, entry):
         blip = super(TracTimelineProvider, self).create_blip(entry)
-        tags = [t['term'] for t in entry.tags]
-        blip.tags.add(*tags)
+        blip.pending_tags = [t['term'] for t in entry.tags]
         try:
             blip.who = entry.author_detail['name']
         except (AttributeError, KeyError):
@@ -207,42 +595,87 @@ class FileSystemChangeProvider(Provider):
         "MOVED_TO" : "moved to",
     }
 
+    # how far the last fetch got through the change log.  The inode and offset let us read just the new lines, and
+    # spot the log being rotated or truncated; a MOVED_FROM still waiting on its MOVED_TO is carried over as well
+    log_inode = models.BigIntegerField(null=True, editable=False)
+    log_offset = models.BigIntegerField(default=0, editable=False)
+    log_pending_move = models.CharField(max_length=255, blank=True, editable=False)
+
+    fetch_state_fields = ('log_inode', 'log_offset', 'log_pending_move')
+
+    def _open_change_log(self):
+        """Open the change log, positioned at the first byte we haven't read yet, along with whether that's a fresh read
+
+        If the log has been rotated (it's a different file) or truncated (it's shorter than where we got up to), or
+        this is the first time it's been read, it gets read from the start
+        """
+        input = open(self.change_log_path, "rb")
+        stat = os.fstat(input.fileno())
+        fresh = stat.st_ino != self.log_inode or stat.st_size < self.log_offset
+        if fresh:
+            if self.log_inode is not None:
+                logger.info("%s has been rotated or truncated, reading it from the start", self.change_log_path)
+            self.log_inode = stat.st_ino
+            self.log_offset = 0
+        input.seek(self.log_offset)
+        return input, fresh
+
     def _fetch_blips(self):
         # Todo: populate summary with more details about path?
         blips = []
-        input = open(self.change_log_path, "r")
-        doing_move = False
-        for line in input.readlines():
-            # extract the various bits from the log file, see Example line:
-            #14:49:40 17:12:2011|/c/Administrative/|MODIFY|tmp
-            (timestamp, path, action, filename) = line.strip().rsplit('|')
-            # convert to more friendly types/formats
-            timestamp = datetime.datetime.strptime(timestamp, "%H:%M:%S %d:%m:%Y").replace(tzinfo=utc)
-            is_dir = action[-6:] == ':ISDIR'
-            if is_dir:
-                action = action[:-6]
-            if action == 'MOVED_FROM':
-                doing_move = filename
-                continue
-            elif action == 'MOVED_TO':
-                if doing_move:
-                    if filename != doing_move:
-                        action = 'renamed from %s to %s' % (doing_move, filename)
+        input, fresh = self._open_change_log()
+        offset = self.log_offset
+        doing_move = self.log_pending_move or False
+        try:
+            for line in input:
+                if not line.endswith('\n'):
+                    # inotifywait is still writing this one, pick it up next time
+                    break
+                line_offset = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                self.record('entries_seen', 1)
+                # extract the various bits from the log file, see Example line:
+                #14:49:40 17:12:2011|/c/Administrative/|MODIFY|tmp
+                (timestamp, path, action, filename) = line.strip().rsplit('|')
+                # convert to more friendly types/formats
+                timestamp = datetime.datetime.strptime(timestamp, "%H:%M:%S %d:%m:%Y").replace(tzinfo=utc)
+                is_dir = action[-6:] == ':ISDIR'
+                if is_dir:
+                    action = action[:-6]
+                if action == 'MOVED_FROM':
+                    doing_move = filename
+                    continue
+                elif action == 'MOVED_TO':
+                    if doing_move:
+                        if filename != doing_move:
+                            action = 'renamed from %s to %s' % (doing_move, filename)
+                        else:
+                            action = 'moved'
+                        doing_move = False
                     else:
-                        action = 'moved'
-                    doing_move = False
+                        raise RuntimeError("Moves out of order, how to handle?")
                 else:
-                    raise RuntimeError("Moves out of order, how to handle?")
-            else:
-                action = self.verbify_dict[action]
-
-            if timestamp > self.last_update:        # make sure we don't import events we've already gotten
-                blip = Blip(
-                    source_url='%s%s' % (self.source_url_root, filename),
-                    title='%s%s has been %s' % ("Directory " if is_dir else "", filename, action),
-                    timestamp=timestamp
-                )
-                blips.append(blip)
+                    action = self.verbify_dict[action]
+
+                # lines past the saved offset are all new; last_update only matters when starting over on a log that may
+                # hold events we've already got.  (The log's times are the server's local time, so they can't be
+                # compared with last_update exactly, and lines written while an update was saving would be missed)
+                if not fresh or timestamp > self.last_update:
+                    blip = Blip(
+                        source_url='%s%s' % (self.source_url_root, filename),
+                        title='%s%s has been %s' % ("Directory " if is_dir else "", filename, action),
+                        timestamp=timestamp,
+                        ingest_key=self.make_ingest_key(line_offset, line.strip())
+                    )
+                    blips.append(blip)
+        finally:
+            input.close()
+
+        self.record('bytes_downloaded', offset - self.log_offset)
+        self.log_offset = offset
+        self.log_pending_move = doing_move or ''
         return blips
 
 
@@ -281,23 +714,21 @@ class GoogleDocsProvider(Provider):
 
         super(GoogleDocsProvider, self).save(*args, **kwargs)
 
-    def _fetch_blips(self):
-        assert self.auth_token, "auth_token must be set before we can fetch %s blips.  " \
-                                "Please set username and password via the admin" % self.__class__.__name__ \
+    def _get_client(self):
+        """A DocsClient logged in with the stored auth token (the tests swap in a stand-in serving canned feeds)"""
+        from gdata.docs.client import DocsClient
+        from gdata.gauth import ClientLoginToken
+        return DocsClient(source=self.application_name, auth_token=ClientLoginToken(self.auth_token))
 
+    def _get_resources(self):
         import getpass
 
         from gdata.client import Unauthorized
-        from gdata.docs.client import DocsClient
-        from gdata.gauth import ClientLoginToken
-
-        blips = []
 
         while True:
             try:
-                client = DocsClient(source=self.application_name, auth_token=ClientLoginToken(self.auth_token))
-                resources = client.GetAllResources()
-                break
+                client = self._get_client()
+                return client, client.GetAllResources()
             except Unauthorized as e:
                 msg = None
                 for m in ('Token expired', 'Token invalid'):
@@ -309,38 +740,293 @@ class GoogleDocsProvider(Provider):
                 self.password = getpass.getpass("Password: ")
                 self.save(console=True)
 
-        for resource in resources:
-            # convert the resource to something we can handle (e.g feedparser data)
-            resource_atom = feedparser.parse(resource.ToString())
-            assert len(resource_atom.entries) == 1, "We assume there is only one entry for each document currently"
-            resource_atom = resource_atom.entries[0]
+    def _get_timestamp(self, text):
+        return datetime.datetime.fromtimestamp(time.mktime(parse_date(text))).replace(tzinfo=utc)
+
+    def _fetch_blips(self):
+        return self._parse_blips(self._fetch_raw())
+
+    def _fetch_raw(self):
+        """The revision feeds of the documents changed since the last update, as (document, feed XML) pairs
 
-            revision_feed = client.get_revisions(resource)
-            revision_atom = feedparser.parse(revision_feed.ToString())
-            for revision in revision_atom.entries:
-                timestamp = datetime.datetime.fromtimestamp(time.mktime(revision.updated_parsed)).replace(tzinfo=utc)
+        The documents' own entries say when each was last changed, so only those changed since last_update have their
+        revisions fetched, PULSE_FETCH_MAX_PER_HOST at a time
+        """
+        assert self.auth_token, "auth_token must be set before we can fetch %s blips.  " \
+                                "Please set username and password via the admin" % self.__class__.__name__
+
+        client, resources = self._get_resources()
+        changed = [r for r in resources if self._get_timestamp(r.updated.text) > self.last_update]
+        if not changed:
+            return []
+        documents = [{
+            'title': resource.title.text,
+            'link': resource.GetAlternateLink().href,
+            'author': resource.author[0].name.text if resource.author else None,
+        } for resource in changed]
+
+        pool = ThreadPool(min(len(changed), getattr(settings, 'PULSE_FETCH_MAX_PER_HOST', 4)))
+        try:
+            revisions = pool.map(lambda resource: client.get_revisions(resource).ToString(), changed, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        return zip(documents, revisions)
+
+    def _parse_blips(self, raw):
+        blips = []
+        for document, revisions in raw:
+            for revision in EntryStream(StringIO(revisions)):
+                self.record('entries_seen', 1)
+                timestamp = self._get_timestamp(revision.updated)
                 if timestamp > self.last_update:
-#                    import pdb; pdb.set_trace()
                     blip = Blip()
                     #  some revisions don't have an author, use the document owner in that case
-                    blip.who = getattr(revision, 'author', resource_atom.author)
-                    blip.title = resource_atom.title
-                    blip.summary="%(title)s edited" % resource_atom
-                    blip.source_url = resource_atom.link
+                    blip.who = revision.get('author', document['author'])
+                    blip.title = document['title']
+                    blip.summary = "%(title)s edited" % document
+                    blip.source_url = document['link']
                     blip.timestamp = timestamp
+                    blip.ingest_key = self.make_ingest_key(revision.get('id') or revision.get('link'), revision.updated)
 
                     blips.append(blip)
 
         return blips
 
 
+def join_authors(whos):
+    """Render the given blip authors for BlipSet.authors"""
+    return u"\n".join(sorted(set(w for w in whos if w)))
+
+
+def _create_tags(names):
+    """Create Tags for the given names, in bulk when nothing gets in the way
+
+    If one of the slugs is already taken (say by another worker creating the same tag), they're created one at a time
+    instead, leaving any names that have turned up in the meantime and letting taggit find the others a free slug
+    """
+    sid = transaction.savepoint()
+    try:
+        tags = []
+        for name in names:
+            tag = Tag(name=name)
+            tag.slug = tag.slugify(name)
+            tags.append(tag)
+        Tag.objects.bulk_create(tags)
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        for name in set(names) - set(Tag.objects.filter(name__in=names).values_list('name', flat=True)):
+            Tag.objects.create(name=name)
+
+
+def bulk_add_tags(tagged):
+    """Tag a batch of saved objects, with a number of queries that doesn't grow with the number of objects or tags
+
+    ``tagged`` is a list of ``(obj, tags)`` pairs, where the tags can be Tag instances or names.  Tags which don't exist
+    yet are created, and all of the TaggedItems are inserted in bulk
+    """
+    names = set()
+    for obj, tags in tagged:
+        names.update(t for t in tags if not isinstance(t, Tag))
+    tags_by_name = {}
+    if names:
+        tags_by_name = dict((t.name, t) for t in Tag.objects.filter(name__in=names))
+        missing = names - set(tags_by_name)
+        if missing:
+            _create_tags(list(missing))
+            tags_by_name = dict((t.name, t) for t in Tag.objects.filter(name__in=names))
+
+    items = []
+    for obj, tags in tagged:
+        content_type = ContentType.objects.get_for_model(obj)
+        tag_ids = set()
+        for t in tags:
+            tag = t if isinstance(t, Tag) else tags_by_name[t]
+            if tag.pk not in tag_ids:
+                tag_ids.add(tag.pk)
+                items.append(TaggedItem(tag=tag, content_type=content_type, object_id=obj.pk))
+    for i in xrange(0, len(items), BULK_CREATE_BATCH_SIZE):
+        TaggedItem.objects.bulk_create(items[i:i + BULK_CREATE_BATCH_SIZE])
+
+    # bulk_create doesn't send any signals, so the tag counts need doing by hand
+    deltas = {}
+    for item in items:
+        content_type_deltas = deltas.setdefault(item.content_type.pk, {})
+        content_type_deltas[item.tag.pk] = content_type_deltas.get(item.tag.pk, 0) + 1
+    for content_type_id, tag_deltas in deltas.items():
+        adjust_tag_counts(content_type_id, tag_deltas)
+
+
+def adjust_tag_counts(content_type_id, deltas):
+    """Add the ``{tag_id: delta}`` changes to the TagCounts for the given content type
+
+    It's one UPDATE for each distinct delta, and a bulk insert for the tags without a count yet.  Counts are only ever
+    created for tags being added: a tag being removed must already have one, unless the tag itself is being deleted (the
+    TaggedItems go after it), in which case there's nothing left to count
+    """
+    counts = TagCount.objects.filter(content_type=content_type_id)
+    tag_ids = [tag_id for tag_id, delta in deltas.items() if delta]
+    existing = set()
+    for i in xrange(0, len(tag_ids), LOOKUP_BATCH_SIZE):
+        existing.update(counts.filter(tag__in=tag_ids[i:i + LOOKUP_BATCH_SIZE]).values_list('tag', flat=True))
+
+    by_delta = {}
+    for tag_id in existing:
+        by_delta.setdefault(deltas[tag_id], []).append(tag_id)
+    for delta, ids in by_delta.items():
+        for i in xrange(0, len(ids), LOOKUP_BATCH_SIZE):
+            counts.filter(tag__in=ids[i:i + LOOKUP_BATCH_SIZE]).update(count=F('count') + delta)
+
+    new_counts = [TagCount(content_type_id=content_type_id, tag_id=tag_id, count=deltas[tag_id])
+                  for tag_id in tag_ids if tag_id not in existing and deltas[tag_id] > 0]
+    if not new_counts:
+        return
+    sid = transaction.savepoint()
+    try:
+        for i in xrange(0, len(new_counts), BULK_CREATE_BATCH_SIZE):
+            TagCount.objects.bulk_create(new_counts[i:i + BULK_CREATE_BATCH_SIZE])
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # someone else got to some of them first
+        transaction.savepoint_rollback(sid)
+        for tag_count in new_counts:
+            _add_tag_count(counts, tag_count)
+
+
+def _add_tag_count(counts, tag_count):
+    """Add one new TagCount's count on to the existing one, or create it"""
+    if counts.filter(tag=tag_count.tag_id).update(count=F('count') + tag_count.count):
+        return
+    sid = transaction.savepoint()
+    try:
+        tag_count.save()
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        counts.filter(tag=tag_count.tag_id).update(count=F('count') + tag_count.count)
+
+
+def prefetch_tags(objects):
+    """Load the tags for a list of objects (all of the same model) in one query, for their tag_list"""
+    by_pk = {}
+    for obj in objects:
+        obj._tag_list_cache = []
+        by_pk[obj.pk] = obj
+    if not by_pk:
+        return
+    content_type = ContentType.objects.get_for_model(objects[0])
+    items = TaggedItem.objects.filter(content_type=content_type, object_id__in=by_pk.keys())
+    for item in items.select_related('tag').order_by('tag__name'):
+        by_pk[item.object_id]._tag_list_cache.append(item.tag)
+
+
+def prefetch_blipsets(blipsets):
+    """Load everything the blipset templates need for a page of blipsets, in a fixed number of queries
+
+    Fills in the blip_list of each single-blip blipset (with the blip's blipset pointing back at it), since those are
+    shown as the blip itself, along with the tag_list of every blipset and blip.  Larger blipsets are rendered from
+    their blip_count and authors alone.  The blipsets' providers should already have been loaded using select_related
+    """
+    by_pk = {}
+    for bs in blipsets:
+        if bs.blip_count == 1:
+            bs._blip_list_cache = []
+            by_pk[bs.pk] = bs
+    blips = []
+    if by_pk:
+        for b in Blip.objects.filter(blipset__in=by_pk.keys()):
+            b.blipset = by_pk[b.blipset_id]
+            b.blipset._blip_list_cache.append(b)
+            blips.append(b)
+    prefetch_tags(blipsets)
+    prefetch_tags(blips)
+
+
+def day_range(day, tz=None):
+    """The start and end (exclusive) of a local day as UTC datetimes, ready for a range query on the timestamps"""
+    tz = tz or get_current_timezone()
+    start = tz.localize(datetime.datetime.combine(day, datetime.time()))
+    end = tz.localize(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()))
+    return start.astimezone(utc), end.astimezone(utc)
+
+
+def count_by_day(queryset, tz=None):
+    """(day, count) for every local day (in the current time zone) with anything in the queryset, newest first
+
+    PostgreSQL buckets the timestamps itself with date_trunc, so only a row per day comes back.  Other databases have
+    no reliable way of converting to a named time zone, so there the timestamps are fetched and bucketed here
+    """
+    tz = tz or get_current_timezone()
+    if connection.vendor == 'postgresql':
+        column = '%s.%s' % (connection.ops.quote_name(queryset.model._meta.db_table),
+                            connection.ops.quote_name('timestamp'))
+        rows = queryset.extra(select={'day': "date_trunc('day', %s AT TIME ZONE %%s)" % column}, select_params=[tz.zone])
+        rows = rows.values('day').annotate(count=Count('pk')).order_by('-day')
+        return [(row['day'].date(), row['count']) for row in rows]
+
+    counts = {}
+    for timestamp in queryset.order_by().values_list('timestamp', flat=True).iterator():
+        day = timestamp.astimezone(tz).date()
+        counts[day] = counts.get(day, 0) + 1
+    return sorted(counts.items(), reverse=True)
+
+
 # signals, etc.
 
 
 def prerender_blipsets(sender, **kwargs):
-    """Before we lose the provider, render all of the BlipSets referencing it"""
+    """Before we lose the provider, render all of the BlipSets referencing it
+
+    The text only depends on the blip_count, so it's one update per distinct count rather than one per blipset.  This
+    runs within the deletion's own transaction
+    """
     provider = kwargs['instance']
-    for bs in provider.blip_sets.all():
-        bs.summary = bs.__unicode__()
-        bs.save()
+    blipsets = provider.blip_sets.order_by()
+    for count in blipsets.values_list('blip_count', flat=True).distinct():
+        bs = BlipSet(provider=provider, blip_count=count)
+        blipsets.filter(blip_count=count).update(summary=bs.__unicode__())
 signals.pre_delete.connect(prerender_blipsets, sender=Provider)
+
+
+def remember_blipset(sender, **kwargs):
+    """Keep track of which blipset a blip started out in, so moving it can update both"""
+    blip = kwargs['instance']
+    blip._original_blipset_id = blip.blipset_id
+signals.post_init.connect(remember_blipset, sender=Blip)
+
+
+def update_blip_stats(sender, **kwargs):
+    """Keep the blipset's blip_count and authors correct as its blips come and go"""
+    blip = kwargs['instance']
+    blipset_ids = set([blip._original_blipset_id, blip.blipset_id]) - set([None])
+    for bs in BlipSet.objects.filter(pk__in=blipset_ids):
+        bs.update_blip_stats()
+    blip._original_blipset_id = blip.blipset_id
+signals.post_save.connect(update_blip_stats, sender=Blip)
+signals.post_delete.connect(update_blip_stats, sender=Blip)
+
+
+def index_blip(sender, **kwargs):
+    """Keep the search index up to date with blips saved one at a time (the ingest indexes its own in bulk)"""
+    index_blips([kwargs['instance'].pk])
+signals.post_save.connect(index_blip, sender=Blip)
+
+
+def unindex_blip(sender, **kwargs):
+    unindex_blips([kwargs['instance'].pk])
+signals.post_delete.connect(unindex_blip, sender=Blip)
+
+
+def count_tag_added(sender, **kwargs):
+    """Keep TagCount up to date as tags get added one at a time (e.g. Blip.extract_tags, or via the admin)"""
+    if kwargs['created']:
+        item = kwargs['instance']
+        adjust_tag_counts(item.content_type_id, {item.tag_id: 1})
+signals.post_save.connect(count_tag_added, sender=TaggedItem)
+
+
+def count_tag_removed(sender, **kwargs):
+    item = kwargs['instance']
+    adjust_tag_counts(item.content_type_id, {item.tag_id: -1})
+signals.post_delete.connect(count_tag_removed, sender=TaggedItem)
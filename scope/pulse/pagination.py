@@ -0,0 +1,71 @@
+"""Keyset pagination for timestamped models, newest first
+
+Pages are found with an indexed range query on ``(timestamp, pk)`` rather than an OFFSET, so getting to a page deep in
+the history costs the same as getting the first one
+"""
+import datetime
+import re
+
+from django.db.models import Q
+from django.utils.timezone import utc
+
+
+_CURSOR_RE = re.compile(r'^(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})(\d{6})-(\d+)$')
+
+
+def encode_cursor(obj):
+    """Build the cursor for an object, e.g. ``20120315015956000000-42``"""
+    # strftime won't handle years before 1900, so format it by hand
+    ts = obj.timestamp.astimezone(utc)
+    return '%04d%02d%02d%02d%02d%02d%06d-%d' % (ts.year, ts.month, ts.day, ts.hour, ts.minute, ts.second,
+                                                ts.microsecond, obj.pk)
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into a ``(timestamp, pk)`` pair, raising ValueError if it's malformed"""
+    m = _CURSOR_RE.match(cursor)
+    if m is None:
+        raise ValueError("Invalid cursor %r" % cursor)
+    values = [int(v) for v in m.groups()]
+    return datetime.datetime(*values[:7], tzinfo=utc), values[7]
+
+
+class KeysetPage(object):
+    """A page of objects plus the cursors for the pages either side of it"""
+
+    def __init__(self, object_list, has_newer, has_older):
+        self.object_list = object_list
+        self.has_newer = has_newer and bool(object_list)
+        self.has_older = has_older and bool(object_list)
+
+    @property
+    def newer_cursor(self):
+        return encode_cursor(self.object_list[0]) if self.has_newer else None
+
+    @property
+    def older_cursor(self):
+        return encode_cursor(self.object_list[-1]) if self.has_older else None
+
+
+def paginate(queryset, per_page, before=None, after=None):
+    """Return the KeysetPage of ``queryset`` just older than ``before`` or just newer than ``after``
+
+    ``before`` and ``after`` are ``(timestamp, pk)`` pairs as returned by decode_cursor; with neither you get the
+    newest page.  Objects come back newest first either way
+    """
+    if after is not None:
+        timestamp, pk = after
+        queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+        object_list = list(queryset.order_by('timestamp', 'pk')[:per_page + 1])
+        has_newer = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        object_list.reverse()
+        # we came from an older page, so there's still one there
+        return KeysetPage(object_list, has_newer=has_newer, has_older=True)
+
+    if before is not None:
+        timestamp, pk = before
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+    object_list = list(queryset.order_by('-timestamp', '-pk')[:per_page + 1])
+    has_older = len(object_list) > per_page
+    return KeysetPage(object_list[:per_page], has_newer=before is not None, has_older=has_older)
@@ -0,0 +1,104 @@
+"""Long-running replacement for calling update_providers from cron"""
+import datetime
+import heapq
+import logging
+import time
+
+from django.db import connection, reset_queries
+from django.utils.timezone import now
+
+from pulse.engine import update_providers
+from pulse.models import Provider
+
+
+logger = logging.getLogger(__name__)
+
+# after a failed pass, wait this many seconds before trying again, doubling each time it keeps failing
+ERROR_BACKOFF = 5
+MAX_ERROR_BACKOFF = 300
+
+
+class Scheduler(object):
+    """Keeps the providers in a priority queue ordered by when they're next due, and updates each one as it comes due
+
+    Only the schedule itself (pk, update_frequency and last_update) is loaded up front, and it gets reloaded every
+    ``refresh_interval`` seconds to pick up providers that have been added, changed or removed in the admin.  Providers
+    are only loaded in full when they're actually being updated
+    """
+
+    def __init__(self, workers=1, refresh_interval=60):
+        self.workers = workers
+        self.refresh_interval = datetime.timedelta(seconds=refresh_interval)
+        self.queue = []
+        self.next_refresh = None
+        # when we last tried each provider.  last_update only moves when something new turns up, so without this a
+        # quiet provider would look due all of the time
+        self.attempted = {}
+
+    def refresh(self):
+        """Rebuild the queue from the current providers in the DB"""
+        self.queue = []
+        pks = set()
+        for pk, update_frequency, last_update in Provider.base_objects.values_list('pk', 'update_frequency', 'last_update'):
+            frequency = datetime.timedelta(minutes=update_frequency)
+            due = last_update + frequency
+            if pk in self.attempted:
+                due = max(due, self.attempted[pk] + frequency)
+            self.queue.append((due, pk, frequency))
+            pks.add(pk)
+        heapq.heapify(self.queue)
+        # forget about anything that's been deleted
+        for pk in set(self.attempted) - pks:
+            del self.attempted[pk]
+        self.next_refresh = now() + self.refresh_interval
+        logger.debug("Scheduling %d providers", len(self.queue))
+
+    def run_pending(self):
+        """Update all of the providers which are due, returning their UpdateResults"""
+        if self.next_refresh is None or now() >= self.next_refresh:
+            self.refresh()
+
+        started = now()
+        due = {}
+        while self.queue and self.queue[0][0] <= started:
+            _, pk, frequency = heapq.heappop(self.queue)
+            due[pk] = frequency
+        if not due:
+            return []
+
+        results = update_providers(Provider.objects.filter(pk__in=due.keys()), workers=self.workers)
+        for result in results:
+            logger.info(result.__unicode__())
+        last_updates = dict(Provider.base_objects.filter(pk__in=due.keys()).values_list('pk', 'last_update'))
+        for pk, frequency in due.items():
+            self.attempted[pk] = started
+            if pk in last_updates:      # it may have been deleted in the meantime
+                heapq.heappush(self.queue, (max(last_updates[pk], started) + frequency, pk, frequency))
+        return results
+
+    def seconds_until_next(self):
+        """How long we can sleep before either a provider is due or the schedule needs reloading"""
+        wake_at = self.next_refresh
+        if self.queue:
+            wake_at = min(wake_at, self.queue[0][0])
+        return max(0, (wake_at - now()).total_seconds())
+
+    def run_forever(self):
+        failures = 0
+        while True:
+            try:
+                self.run_pending()
+                failures = 0
+            except Exception:
+                # most likely the DB has gone away; reload the schedule from scratch once it's back
+                failures += 1
+                self.next_refresh = None
+                logger.exception("Scheduler pass failed (%d in a row)", failures)
+            # don't hang on to anything between passes; DEBUG query logging would otherwise grow forever, and a
+            # fresh connection copes with the DB having restarted while we slept
+            reset_queries()
+            connection.close()
+            if failures:
+                time.sleep(min(ERROR_BACKOFF * 2 ** (failures - 1), MAX_ERROR_BACKOFF))
+            else:
+                time.sleep(self.seconds_until_next())
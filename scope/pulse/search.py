@@ -0,0 +1,175 @@
+"""Full-text search over blips' titles, summaries and authors
+
+The index lives in its own table next to pulse_blip, in whatever form the database does full-text search best:
+
+* PostgreSQL: a tsvector per blip (title weighted above author above summary) under a GIN index, ranked by
+  ts_rank_cd
+* SQLite: an FTS4 table, ranked by a small tf-idf function over its matchinfo(), weighting the columns the same way
+
+The table is created by syncdb (see pulse.management), the ingest indexes blips as it saves them, and saving or deleting
+a single blip keeps it up to date (see the signal handlers in pulse.models).  ``manage.py rebuild_search_index`` builds
+it from scratch.  Like the ORM's, the writes are committed straight away unless they're part of a managed
+transaction.  There's deliberately no foreign key to pulse_blip, which would stop flush from truncating that; a stray
+row for a deleted blip is simply skipped by the views.  Other databases have no index, and searching them raises
+SearchUnavailable
+"""
+import array
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+
+
+BLIP_TABLE = 'pulse_blip'
+SEARCH_TABLE = 'pulse_blip_search'
+# relative weights of the title, who and summary columns
+SQLITE_COLUMN_WEIGHTS = (3.0, 2.0, 1.0)
+# keeps the IN (...) lists under the bound-parameter limits, like LOOKUP_BATCH_SIZE in pulse.models
+INDEX_BATCH_SIZE = 500
+
+
+class SearchUnavailable(Exception):
+    """The database doesn't support full-text search"""
+
+
+def _search_config():
+    return getattr(settings, 'PULSE_SEARCH_CONFIG', 'english')
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+class PostgresBackend(object):
+    def create_index(self, cursor):
+        cursor.execute("CREATE TABLE %s (blip_id integer PRIMARY KEY, document tsvector NOT NULL)" % SEARCH_TABLE)
+        cursor.execute("CREATE INDEX %s_document ON %s USING gin(document)" % (SEARCH_TABLE, SEARCH_TABLE))
+
+    def index(self, cursor, pks):
+        self.unindex(cursor, pks)
+        cursor.execute("INSERT INTO %s (blip_id, document) "
+                       "SELECT id, setweight(to_tsvector(%%s, coalesce(title, '')), 'A') || "
+                       "setweight(to_tsvector(%%s, coalesce(who, '')), 'B') || "
+                       "setweight(to_tsvector(%%s, coalesce(summary, '')), 'C') "
+                       "FROM %s WHERE id IN (%s)" % (SEARCH_TABLE, BLIP_TABLE, _placeholders(pks)),
+                       [_search_config()] * 3 + list(pks))
+
+    def unindex(self, cursor, pks):
+        cursor.execute("DELETE FROM %s WHERE blip_id IN (%s)" % (SEARCH_TABLE, _placeholders(pks)), list(pks))
+
+    def clear(self, cursor):
+        cursor.execute("TRUNCATE %s" % SEARCH_TABLE)
+
+    def search(self, cursor, query, limit, offset):
+        cursor.execute("SELECT blip_id FROM %s, plainto_tsquery(%%s, %%s) query WHERE document @@ query "
+                       "ORDER BY ts_rank_cd(document, query) DESC, blip_id DESC LIMIT %%s OFFSET %%s" % SEARCH_TABLE,
+                       [_search_config(), query, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _sqlite_rank(matchinfo):
+    """tf-idf-ish score from FTS4's matchinfo(table, 'pcx'), favouring hits in the more heavily weighted columns"""
+    info = array.array('I', str(matchinfo))
+    phrases, columns = info[0], info[1]
+    score = 0.0
+    for phrase in xrange(phrases):
+        for column in xrange(columns):
+            offset = 2 + 3 * (phrase * columns + column)
+            hits_here, hits_everywhere = info[offset], info[offset + 1]
+            if hits_everywhere:
+                score += SQLITE_COLUMN_WEIGHTS[column] * hits_here / float(hits_everywhere)
+    return score
+
+
+class SQLiteBackend(object):
+    def create_index(self, cursor):
+        cursor.execute("CREATE VIRTUAL TABLE %s USING fts4(title, who, summary)" % SEARCH_TABLE)
+
+    def index(self, cursor, pks):
+        self.unindex(cursor, pks)
+        cursor.execute("INSERT INTO %s (docid, title, who, summary) SELECT id, title, who, summary FROM %s "
+                       "WHERE id IN (%s)" % (SEARCH_TABLE, BLIP_TABLE, _placeholders(pks)), list(pks))
+
+    def unindex(self, cursor, pks):
+        cursor.execute("DELETE FROM %s WHERE docid IN (%s)" % (SEARCH_TABLE, _placeholders(pks)), list(pks))
+
+    def clear(self, cursor):
+        cursor.execute("DELETE FROM %s" % SEARCH_TABLE)
+
+    def search(self, cursor, query, limit, offset):
+        # quote every word, so that they're all required and nothing in them is taken for FTS query syntax
+        terms = ' '.join('"%s"' % word.replace('"', '') for word in query.split() if word.replace('"', ''))
+        if not terms:
+            return []
+        cursor.execute("SELECT docid FROM %s WHERE %s MATCH %%s ORDER BY pulse_rank(matchinfo(%s, 'pcx')) DESC, "
+                       "docid DESC LIMIT %%s OFFSET %%s" % (SEARCH_TABLE, SEARCH_TABLE, SEARCH_TABLE),
+                       [terms, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def register_sqlite_rank(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('pulse_rank', 1, _sqlite_rank)
+connection_created.connect(register_sqlite_rank)
+
+
+BACKENDS = {
+    'postgresql': PostgresBackend(),
+    'sqlite': SQLiteBackend(),
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor)
+
+
+def create_index():
+    """Create the search table, if the database supports it and it isn't there already"""
+    backend = get_backend()
+    if backend is None or SEARCH_TABLE in connection.introspection.table_names():
+        return False
+    backend.create_index(connection.cursor())
+    transaction.commit_unless_managed()
+    return True
+
+
+def _batches(pks):
+    pks = list(pks)
+    for i in xrange(0, len(pks), INDEX_BATCH_SIZE):
+        yield pks[i:i + INDEX_BATCH_SIZE]
+
+
+def index_blips(pks):
+    """(Re)index the blips with the given pks"""
+    backend = get_backend()
+    if backend is None:
+        return
+    cursor = connection.cursor()
+    for batch in _batches(pks):
+        backend.index(cursor, batch)
+    transaction.commit_unless_managed()
+
+
+def unindex_blips(pks):
+    backend = get_backend()
+    if backend is None:
+        return
+    cursor = connection.cursor()
+    for batch in _batches(pks):
+        backend.unindex(cursor, batch)
+    transaction.commit_unless_managed()
+
+
+def clear_index():
+    backend = get_backend()
+    if backend is not None:
+        backend.clear(connection.cursor())
+        transaction.commit_unless_managed()
+
+
+def search_blips(query, limit, offset=0):
+    """The pks of the blips matching the query (all of its words), best match first"""
+    backend = get_backend()
+    if backend is None:
+        raise SearchUnavailable("Full-text search isn't supported on %s" % connection.vendor)
+    return backend.search(connection.cursor(), query, limit, offset)
@@ -0,0 +1,57 @@
+"""Summaries of the providers' recent updates, from the UpdateRuns recorded for each of them
+
+Used by the status page and the provider_status management command
+"""
+import math
+
+from django.utils.timezone import now
+
+from pulse.models import Provider, UpdateRun
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of the values, or None if there aren't any"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(fraction * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def provider_status(provider, runs):
+    """Stats for one provider from its runs (newest first)
+
+    Staleness is how many of its update periods have passed since the provider last updated successfully, whether or
+    not that turned up anything new (last_update, when the newest blips were saved, is reported separately as
+    last_new_content): anything much over 1 means its updates are failing or falling behind
+    """
+    durations = [run.duration for run in runs]
+    errors = [run for run in runs if run.error]
+    successes = [run for run in runs if not run.error]
+    last_success = successes[0].started if successes else provider.last_update
+    staleness = None
+    if provider.update_frequency:
+        staleness = (now() - last_success).total_seconds() / (provider.update_frequency * 60.0)
+    return {
+        'provider': provider,
+        'runs': len(runs),
+        'failures': len(errors),
+        'last_run': runs[0] if runs else None,
+        'last_error': errors[0] if errors else None,
+        'p50': percentile(durations, 0.5),
+        'p95': percentile(durations, 0.95),
+        'bytes_downloaded': sum(run.bytes_downloaded for run in runs),
+        'entries_seen': sum(run.entries_seen for run in runs),
+        'blips_created': sum(run.blips_created for run in runs),
+        'last_success': successes[0] if successes else None,
+        'last_new_content': provider.last_update,
+        'staleness': staleness,
+    }
+
+
+def all_provider_status():
+    """provider_status() for every provider, fetching all of their runs in one query"""
+    runs = {}
+    for run in UpdateRun.objects.order_by('provider', '-started', '-pk'):
+        runs.setdefault(run.provider_id, []).append(run)
+    return [provider_status(provider, runs.get(provider.pk, [])) for provider in Provider.objects.order_by('pk')]
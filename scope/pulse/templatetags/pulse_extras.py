@@ -1,10 +1,20 @@
+import hashlib
 from datetime import datetime, timedelta
 
 from django import template
-from django.utils.timezone import get_current_timezone
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import get_cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.timezone import get_current_timezone, get_current_timezone_name
+
+from pulse.models import TagCount
 
 register = template.Library()
 
+fragment_cache = get_cache(getattr(settings, 'PULSE_FRAGMENT_CACHE', 'default'))
+
 
 class GetDailyTimestampNode(template.Node):
     """Stores a given timestamp if the day has changed"""
@@ -40,4 +50,83 @@ def get_daily_timestamp(parser, token):
         raise template.TemplateSyntaxError("Usage: %s timestamp as varname" % tag_name)
     if context_var_name[0] == context_var_name[-1] and context_var_name[0] in ('"', "'"):
         raise template.TemplateSyntaxError("%r tag's varname argument should not be in quotes" % tag_name)
-    return GetDailyTimestampNode(timestamp, context_var_name)
\ No newline at end of file
+    return GetDailyTimestampNode(timestamp, context_var_name)
+
+
+# Rendered blip/blipset fragments are cached under a key made from the object's pk and a version, where the version is
+# a fingerprint of everything the fragment shows (tags, provider name, summary_format, ...).  Any change to those
+# gives a new key, so there's nothing to invalidate by hand and it works the same whether the cache is per-process
+# (locmem) or shared between processes (file, memcached).  Stale fragments just age out.
+
+
+def _fragment_key(kind, obj, *parts):
+    parts = (get_current_timezone_name(),) + parts
+    version = hashlib.md5(u'\x00'.join(unicode(p) for p in parts).encode('utf-8')).hexdigest()
+    return 'pulse:fragment:%s:%s:%s' % (kind, obj.pk, version)
+
+
+def _tags_fingerprint(obj):
+    return u','.join(u'%s=%s' % (t.slug, t.name) for t in obj.tag_list)
+
+
+def blip_fragment_key(blip):
+    provider = blip.blipset.provider if blip.blipset_id else None
+    return _fragment_key('blip', blip, blip.source_url, blip.title, blip.who, blip.summary, blip.timestamp.isoformat(),
+                         _tags_fingerprint(blip), provider.name if provider else u'')
+
+
+def blipset_fragment_key(blipset):
+    # the blipset's text covers the count, the provider's name and summary_format, and the provider being deleted
+    return _fragment_key('blipset', blipset, blipset, blipset.authors, blipset.timestamp.isoformat(),
+                         _tags_fingerprint(blipset))
+
+
+def _render_fragment(key, template_name, context):
+    html = fragment_cache.get(key)
+    if html is None:
+        html = render_to_string(template_name, context)
+        fragment_cache.set(key, html, getattr(settings, 'PULSE_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24))
+    return mark_safe(html)
+
+
+@register.simple_tag
+def render_blip(blip):
+    """Renders pulse/includes/blip.txt for the blip, reusing the cached copy if nothing it shows has changed"""
+    return _render_fragment(blip_fragment_key(blip), 'pulse/includes/blip.txt', {'blip': blip})
+
+
+@register.simple_tag
+def render_blipset(blipset):
+    """Renders pulse/includes/blipset.txt for the blipset, reusing the cached copy if nothing it shows has changed"""
+    return _render_fragment(blipset_fragment_key(blipset), 'pulse/includes/blipset.txt', {'blipset': blipset})
+
+
+@register.assignment_tag
+def get_tag_cloud(model_name):
+    """Returns the tags used on a model ('app_label.Model'), each with its num_times and a weight for its font size
+
+    Reads the counts maintained in TagCount, so it's one indexed query.  Weights are spread between
+    TAGGIT_TAGCLOUD_MIN and TAGGIT_TAGCLOUD_MAX the same way as taggit_templatetags' get_tagcloud
+    """
+    app_label, model = model_name.split('.')
+    content_type = ContentType.objects.get_by_natural_key(app_label, model.lower())
+    counts = TagCount.objects.filter(content_type=content_type, count__gt=0).select_related('tag').order_by('tag__name')
+    tags = []
+    for tag_count in counts:
+        tag = tag_count.tag
+        tag.num_times = tag_count.count
+        tags.append(tag)
+    if not tags:
+        return tags
+
+    t_min = getattr(settings, 'TAGGIT_TAGCLOUD_MIN', 1.0)
+    t_max = getattr(settings, 'TAGGIT_TAGCLOUD_MAX', 6.0)
+    f_min = min(t.num_times for t in tags)
+    f_max = max(t.num_times for t in tags)
+    if f_max == f_min:
+        mult_fac = 1.0
+    else:
+        mult_fac = float(t_max - t_min) / float(f_max - f_min)
+    for tag in tags:
+        tag.weight = t_max - (f_max - tag.num_times) * mult_fac
+    return tags
@@ -1,18 +1,70 @@
+import BaseHTTPServer
+import gzip
+import json
 import os
 import posixpath
-from datetime import datetime
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+import time
+import types
+import zlib
+from StringIO import StringIO
+from datetime import datetime, timedelta
 
+import feedparser
 from django.conf import settings
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.core.management import call_command
+from django.db import DatabaseError, connection, reset_queries
+from django.db.models import signals
+from django.test import TestCase, TransactionTestCase
+from django.test.client import Client
+from django.test.utils import override_settings
 from django.utils.timezone import now
 from pytz import timezone, utc
+from taggit.models import Tag
 
-from pulse.models import BlipSet, Provider, Blip, FileSystemChangeProvider, TracTimelineProvider
+from pulse import archive, bench, fetch, scheduler
+from pulse.archive import archive_expired, expired_blipsets
+from pulse.engine import run_pipeline, update_providers
+from pulse.feeds import feed_cache
+from pulse.feedstream import EntryStream
+from pulse.fetch import FetchError, Session
+from pulse.middleware import ProfilingMiddleware, profiles
+from pulse.templatetags.pulse_extras import (blip_fragment_key, blipset_fragment_key, fragment_cache, get_tag_cloud,
+                                             render_blip)
+from pulse.models import (ArchivedBlip, ArchivedBlipSet, BlipSet, count_by_day, day_range, GoogleDocsProvider,
+                          KunenaProvider, Provider, Blip, FileSystemChangeProvider, RSSProvider, TracTimelineProvider,
+                          TagCount, UpdateRun, bulk_add_tags)
+from pulse.scheduler import Scheduler
+from pulse.search import clear_index, search_blips
+from pulse.status import all_provider_status, percentile
 
 
 TEST_DIR = os.path.dirname(__file__)
 
 
+def count_queries(func, *args, **kwargs):
+    """Run the function, returning how many queries it took"""
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    # like assertNumQueries, stop the test client's requests from clearing the log part-way through
+    request_started.disconnect(reset_queries)
+    try:
+        start = len(connection.queries)
+        func(*args, **kwargs)
+        return len(connection.queries) - start
+    finally:
+        request_started.connect(reset_queries)
+        connection.use_debug_cursor = old_debug_cursor
+
+
 class TimelineTest(TestCase):
     def setUp(self):
         blipset1 = BlipSet.objects.create(summary="Test")
@@ -29,6 +81,272 @@ class TimelineTest(TestCase):
         self.assertContains(response, "Monday, Jan 01")
 
 
+class TimelineQueryCountTest(TestCase):
+    def setUp(self):
+        self.provider = Provider.objects.create(update_frequency=1440, name='TestProvider', summary_format='Test %(count)d %(source)s')
+        self._add_blipsets(2)
+
+    def _add_blipsets(self, count):
+        for i in range(count):
+            bs = BlipSet.objects.create(provider=self.provider)
+            bs.tags.add('common', 'set%d' % (i % 3))
+            for j in range(i % 3 + 1):
+                b = Blip.objects.create(title='Blip %d' % j, source_url='http://example.com', who='Person %d' % j,
+                                        timestamp=now(), blipset=bs)
+                b.tags.add('blip%d' % j)
+        BlipSet.objects.create(summary="Manual update")
+
+    def test_queries_dont_grow(self):
+        self.client.get('/pulse/timeline')     # warm up the ContentType cache
+        queries = count_queries(self.client.get, '/pulse/timeline')
+        self._add_blipsets(10)
+        with self.assertNumQueries(queries):
+            response = self.client.get('/pulse/timeline')
+        self.assertEqual(len(response.context['object_list']), 14)
+        self.assertContains(response, "Test 3 TestProvider")
+        self.assertContains(response, "by Person 0, Person 1")
+
+
+@override_settings(PULSE_TIMELINE_PAGE_SIZE=2)
+class TimelinePaginationTest(TestCase):
+    def setUp(self):
+        for day in range(1, 6):
+            bs = BlipSet.objects.create(summary="Day %d" % day)
+            bs.timestamp = datetime(2012, 3, day, 12, tzinfo=utc)
+            bs.save()
+            bs.tags.add('even' if day % 2 == 0 else 'odd')
+
+    def _summaries(self, response):
+        return [bs.summary for bs in response.context['object_list']]
+
+    def test_older_and_newer(self):
+        response = self.client.get('/pulse/timeline')
+        self.assertEqual(self._summaries(response), ["Day 5", "Day 4"])
+        self.assertIsNone(response.context['newer_url'])
+
+        response = self.client.get('/pulse/timeline' + response.context['older_url'])
+        self.assertEqual(self._summaries(response), ["Day 3", "Day 2"])
+
+        older = self.client.get('/pulse/timeline' + response.context['older_url'])
+        self.assertEqual(self._summaries(older), ["Day 1"])
+        self.assertIsNone(older.context['older_url'])
+
+        newer = self.client.get('/pulse/timeline' + response.context['newer_url'])
+        self.assertEqual(self._summaries(newer), ["Day 5", "Day 4"])
+
+    def test_filters_kept(self):
+        odd = Tag.objects.get(name='odd')
+        response = self.client.get('/pulse/timeline', {'tags': odd.pk})
+        self.assertEqual(self._summaries(response), ["Day 5", "Day 3"])
+        response = self.client.get('/pulse/timeline' + response.context['older_url'])
+        self.assertEqual(self._summaries(response), ["Day 1"])
+
+    def test_bad_cursor(self):
+        response = self.client.get('/pulse/timeline', {'before': 'garbage'})
+        self.assertEqual(self._summaries(response), ["Day 5", "Day 4"])
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        for day in range(1, 6):
+            bs = BlipSet.objects.create(summary="Day %d" % day)
+            bs.timestamp = datetime(2012, 3, day, 12, tzinfo=utc)
+            bs.save()
+            bs.tags.add('even' if day % 2 == 0 else 'odd')
+            blip = Blip.objects.create(title="Blip %d" % day, summary="Did stuff", who="dave", blipset=bs,
+                                       timestamp=bs.timestamp)
+            blip.tags.add('stuff')
+
+    def _get(self, url, data=None, **extra):
+        response = self.client.get(url, data or {}, **extra)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response, json.loads(response.content)
+
+    def test_blipsets(self):
+        response, data = self._get('/pulse/api/blipsets', {'limit': 2})
+        self.assertEqual([o['summary'] for o in data['objects']], ["Day 5", "Day 4"])
+        self.assertEqual(data['objects'][0]['tags'], ['odd'])
+        self.assertEqual(data['objects'][0]['authors'], ['dave'])
+        self.assertIsNone(data['newer'])
+
+        response, data = self._get('/pulse/api/blipsets', {'limit': 2, 'before': data['older']})
+        self.assertEqual([o['summary'] for o in data['objects']], ["Day 3", "Day 2"])
+
+    def test_filters(self):
+        odd = Tag.objects.get(name='odd')
+        response, data = self._get('/pulse/api/blipsets', {'tags': odd.pk})
+        self.assertEqual([o['summary'] for o in data['objects']], ["Day 5", "Day 3", "Day 1"])
+
+        blipset = BlipSet.objects.get(summary="Day 2")
+        response, data = self._get('/pulse/api/blips', {'blipset': blipset.pk})
+        self.assertEqual([o['title'] for o in data['objects']], ["Blip 2"])
+        self.assertEqual(data['objects'][0]['tags'], ['stuff'])
+
+    def test_tags(self):
+        response, data = self._get('/pulse/api/tags')
+        self.assertEqual(data['objects'], [{'name': 'even', 'slug': 'even', 'count': 2},
+                                           {'name': 'odd', 'slug': 'odd', 'count': 3}])
+        response, data = self._get('/pulse/api/tags', {'model': 'blips'})
+        self.assertEqual(data['objects'], [{'name': 'stuff', 'slug': 'stuff', 'count': 5}])
+
+    def test_conditional_get(self):
+        response = self.client.get('/pulse/api/blipsets')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/pulse/api/blipsets', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/pulse/api/blipsets',
+                                         HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        BlipSet.objects.create(summary="Day 6")
+        self.assertEqual(self.client.get('/pulse/api/blipsets', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        feed_cache.clear()
+        self.provider = Provider.objects.create(update_frequency=1440, name='TestProvider',
+                                                summary_format='%(count)d from %(source)s')
+        for day in range(1, 4):
+            self._add_blipset(day)
+
+    def _add_blipset(self, day):
+        bs = BlipSet.objects.create(provider=self.provider)
+        bs.timestamp = datetime(2012, 3, day, 12, tzinfo=utc)
+        bs.save()
+        bs.tags.add('odd' if day % 2 else 'even')
+        blip = Blip.objects.create(title="Blip %d" % day, summary="Did stuff", who="dave", blipset=bs,
+                                   source_url='http://example.com/%d' % day, timestamp=bs.timestamp)
+        blip.tags.add('stuff')
+        return bs
+
+    def test_timeline_feed(self):
+        response = self.client.get('/pulse/timeline/feed')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/atom+xml'))
+        self.assertContains(response, '<title>1 from TestProvider</title>', count=3)
+        self.assertContains(response, 'Blip 3')
+
+    def test_tag_feeds(self):
+        response = self.client.get('/pulse/tags/odd/feed')
+        self.assertContains(response, '<entry>', count=2)
+        response = self.client.get('/pulse/blip/tags/stuff/feed')
+        self.assertContains(response, '<title>Blip 2</title>')
+        self.assertEqual(self.client.get('/pulse/tags/nonexistent/feed').status_code, 404)
+
+    def test_snapshot(self):
+        self.client.get('/pulse/timeline/feed')
+        # nothing new, so only the newest blipset gets looked up
+        self.assertEqual(count_queries(self.client.get, '/pulse/timeline/feed'), 1)
+
+        self._add_blipset(4)
+        response = self.client.get('/pulse/timeline/feed')
+        self.assertContains(response, '<entry>', count=4)
+        self.assertContains(response, 'Blip 4')
+
+    def test_empty_snapshot(self):
+        Tag.objects.create(name='new', slug='new')
+        self.assertContains(self.client.get('/pulse/tags/new/feed'), '<entry>', count=0)
+        bs = self._add_blipset(4)
+        bs.tags.add('new')
+        self.assertContains(self.client.get('/pulse/tags/new/feed'), '<entry>', count=1)
+
+        BlipSet.objects.all().delete()
+        self.assertContains(self.client.get('/pulse/timeline/feed'), '<entry>', count=0)
+        self._add_blipset(5)
+        self.assertContains(self.client.get('/pulse/timeline/feed'), '<entry>', count=1)
+
+    def test_changes_refreshed(self):
+        self.client.get('/pulse/timeline/feed')
+        self.client.get('/pulse/blip/tags/stuff/feed')
+        blip = Blip.objects.get(title="Blip 3")
+        blip.title = "Blip three"
+        blip.save()
+        self.assertContains(self.client.get('/pulse/blip/tags/stuff/feed'), '<title>Blip three</title>')
+
+        BlipSet.objects.get(timestamp=datetime(2012, 3, 1, 12, tzinfo=utc)).delete()
+        self.assertContains(self.client.get('/pulse/timeline/feed'), '<entry>', count=2)
+
+        self.client.get('/pulse/timeline/feed')
+        self.provider.retention_days = 1
+        self.provider.save()
+        archive_expired()
+        self.assertContains(self.client.get('/pulse/timeline/feed'), '<entry>', count=0)
+
+    def test_conditional_get(self):
+        response = self.client.get('/pulse/timeline/feed')
+        self.assertEqual(self.client.get('/pulse/timeline/feed', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         304)
+        self._add_blipset(4)
+        self.assertEqual(self.client.get('/pulse/timeline/feed', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         200)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.provider = TracTimelineProvider.objects.create(update_frequency=5, url=os.path.join(TEST_DIR, 'trac.xml'))
+        self.provider.update()
+
+    def test_ingest_indexed(self):
+        pks = search_blips("stuff", 10)
+        self.assertEqual(set(Blip.objects.get(pk=pk).title for pk in pks), set([
+            'Changeset [5e5d4b6]: Did some stuff',
+            'Changeset [6b8bcb6]: Did more stuff',
+            'Changeset [bc5f099]: Did yet more stuff',
+            'Changeset [81d0551]: Did even more stuff',
+        ]))
+        self.assertEqual([Blip.objects.get(pk=pk).title for pk in search_blips("yet more stuff", 10)],
+                         ['Changeset [bc5f099]: Did yet more stuff'])
+        self.assertEqual(search_blips("nothing-like-this", 10), [])
+
+    def test_ranked(self):
+        Blip.objects.create(title="Unrelated", summary="mentions wikistart in passing", timestamp=now())
+        titles = [Blip.objects.get(pk=pk).title for pk in search_blips("wikistart", 10)]
+        self.assertEqual(titles, ["WikiStart edited", "Unrelated"])
+
+    def test_single_blips_kept_up_to_date(self):
+        blip = Blip.objects.create(title="Lunch", summary="Fish and chips", who="dave", timestamp=now())
+        self.assertEqual(search_blips("chips", 10), [blip.pk])
+        self.assertEqual(search_blips("dave", 10), [blip.pk])
+        blip.summary = "Pie"
+        blip.save()
+        self.assertEqual(search_blips("chips", 10), [])
+        blip.delete()
+        self.assertEqual(search_blips("lunch", 10), [])
+
+    def test_rebuild(self):
+        clear_index()
+        self.assertEqual(search_blips("stuff", 10), [])
+        call_command('rebuild_search_index', verbosity=0)
+        self.assertEqual(len(search_blips("stuff", 10)), 4)
+
+    @override_settings(PULSE_TIMELINE_PAGE_SIZE=3)
+    def test_view(self):
+        response = self.client.get('/pulse/search', {'q': 'stuff'})
+        self.assertEqual(len(response.context['object_list']), 3)
+        self.assertIsNone(response.context['previous_url'])
+        response = self.client.get('/pulse/search' + response.context['next_url'])
+        self.assertEqual(len(response.context['object_list']), 1)
+        self.assertIsNone(response.context['next_url'])
+
+    def test_api(self):
+        response = self.client.get('/pulse/api/search', {'q': 'did stuff', 'limit': 3})
+        data = json.loads(response.content)
+        self.assertEqual(len(data['objects']), 3)
+        self.assertTrue(data['has_next'])
+        self.assertEqual(self.client.get('/pulse/api/search').status_code, 400)
+
+
+class SearchCommitTest(TransactionTestCase):
+    def test_single_blip_committed(self):
+        blip = Blip.objects.create(title='Standalone blip', source_url='http://example.com', timestamp=now())
+        # anything left uncommitted outside of a managed transaction would be thrown away here
+        connection.rollback()
+        self.assertEqual(search_blips('standalone', 10), [blip.pk])
+        blip.delete()
+        connection.rollback()
+        self.assertEqual(search_blips('standalone', 10), [])
+
+
 class BlipSetTest(TestCase):
     def setUp(self):
         self.provider = Provider.objects.create(update_frequency=1440, name='TestProvider', summary_format='Test %(count)d %(source)s')
@@ -37,6 +355,15 @@ class BlipSetTest(TestCase):
         bs = BlipSet.objects.create(provider=self.provider)
         self.assertEqual(bs.__unicode__(), "Test 0 TestProvider")
 
+    def test_provider_delete_batched(self):
+        for count in (1, 2, 2, 3, 1, 2):
+            BlipSet.objects.create(provider=self.provider, blip_count=count)
+        expected = sorted(bs.__unicode__() for bs in BlipSet.objects.select_related('provider'))
+        # a query for the distinct counts and an update for each of them, however many blipsets there are
+        with self.assertNumQueries(4):
+            signals.pre_delete.send(sender=Provider, instance=self.provider)
+        self.assertEqual(sorted(BlipSet.objects.values_list('summary', flat=True)), expected)
+
     def test_extract_tags(self):
         wid_blip = Blip.objects.create(
             title=u"What I'm up to",
@@ -63,6 +390,156 @@ class BlipSetTest(TestCase):
         assert tag_lie
         assert tag_truth
 
+    def _blip(self, who, blipset):
+        return Blip.objects.create(title=u"Blip", source_url='http://example.com', who=who, timestamp=now(),
+                                   blipset=blipset)
+
+    def test_blip_stats(self):
+        bs = BlipSet.objects.create(provider=self.provider)
+        other = BlipSet.objects.create(provider=self.provider)
+        self._blip(u"Joey", bs)
+        moved = self._blip(u"Alice", bs)
+        self._blip(None, bs)
+        bs = BlipSet.objects.get(pk=bs.pk)
+        self.assertEqual(bs.__unicode__(), "Test 3 TestProvider")
+        self.assertEqual(bs.author_list, [u"Alice", u"Joey"])
+
+        moved.blipset = other
+        moved.save()
+        bs = BlipSet.objects.get(pk=bs.pk)
+        self.assertEqual((bs.blip_count, bs.author_list), (2, [u"Joey"]))
+        self.assertEqual(BlipSet.objects.get(pk=other.pk).author_list, [u"Alice"])
+
+        moved.delete()
+        self.assertEqual(BlipSet.objects.get(pk=other.pk).blip_count, 0)
+
+    def test_backfill_blip_stats(self):
+        bs = BlipSet.objects.create(provider=self.provider)
+        self._blip(u"Joey", bs)
+        self._blip(u"Alice", bs)
+        BlipSet.objects.update(blip_count=0, authors='')
+        call_command('backfill_blipset_stats', verbosity=0)
+        bs = BlipSet.objects.get(pk=bs.pk)
+        self.assertEqual((bs.blip_count, bs.author_list), (2, [u"Alice", u"Joey"]))
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        self.provider = Provider.objects.create(update_frequency=1440, name='TestProvider', summary_format='Test %(count)d %(source)s')
+        self.blipset = BlipSet.objects.create(provider=self.provider)
+        self.blip = Blip.objects.create(title=u"Blip", source_url='http://example.com', who=u"Joey", timestamp=now(),
+                                        blipset=self.blipset)
+
+    def _keys(self):
+        blipset = BlipSet.objects.get(pk=self.blipset.pk)
+        blip = Blip.objects.get(pk=self.blip.pk)
+        return blipset_fragment_key(blipset), blip_fragment_key(blip)
+
+    def test_cached(self):
+        blip = Blip.objects.get(pk=self.blip.pk)
+        html = render_blip(blip)
+        self.assertIn(u"by Joey", html)
+        fragment_cache.set(blip_fragment_key(blip), u"cached")
+        self.assertEqual(render_blip(Blip.objects.get(pk=self.blip.pk)), u"cached")
+
+    def test_unchanged(self):
+        self.assertEqual(self._keys(), self._keys())
+
+    def test_tags_change(self):
+        blipset_key, blip_key = self._keys()
+        self.blip.tags.add('new')
+        self.assertEqual(self._keys()[0], blipset_key)
+        self.assertNotEqual(self._keys()[1], blip_key)
+        self.blipset.tags.add('new')
+        self.assertNotEqual(self._keys()[0], blipset_key)
+
+    def test_provider_change(self):
+        keys = self._keys()
+        self.provider.summary_format = 'Other %(count)d %(source)s'
+        self.provider.save()
+        self.assertNotEqual(self._keys()[0], keys[0])
+        keys = self._keys()
+        self.provider.name = 'Renamed'
+        self.provider.save()
+        new_keys = self._keys()
+        self.assertNotEqual(new_keys[0], keys[0])
+        self.assertNotEqual(new_keys[1], keys[1])
+        self.provider.delete()
+        self.assertNotEqual(self._keys(), new_keys)
+
+    def test_list_and_detail_queries_dont_grow(self):
+        def add_blips(count):
+            blipset = BlipSet.objects.create(provider=self.provider)
+            blipset.tags.add('tagged')
+            for i in range(count):
+                blip = Blip.objects.create(title=u"Blip %d" % i, source_url='http://example.com', timestamp=now(),
+                                           blipset=blipset)
+                blip.tags.add('tagged')
+            return blipset
+        urls = lambda blipset: ['/pulse/tags/tagged', '/pulse/blip/tags/tagged', blipset.get_absolute_url()]
+        blipset = add_blips(1)
+        for url in urls(blipset):
+            self.client.get(url)    # warm up the fragment cache
+        queries = [count_queries(self.client.get, url) for url in urls(blipset)]
+        blipset = add_blips(5)
+        for url in urls(blipset):
+            self.client.get(url)
+        self.assertEqual([count_queries(self.client.get, url) for url in urls(blipset)], queries)
+        response = self.client.get(blipset.get_absolute_url())
+        self.assertContains(response, u"Blip 4")
+        self.assertContains(response, u"via TestProvider", count=5)
+
+
+class TagCountTest(TestCase):
+    def setUp(self):
+        self.provider = TracTimelineProvider.objects.create(
+            update_frequency = 5,
+            url = os.path.join(TEST_DIR, "trac.xml"),
+        )
+        self.provider.tags.add('trac')
+        self.provider.update()
+
+    def _counts(self, model):
+        content_type = ContentType.objects.get_for_model(model)
+        return dict((tc.tag.name, tc.count) for tc in TagCount.objects.filter(content_type=content_type))
+
+    def test_ingest_counts(self):
+        self.assertEqual(self._counts(Blip), {'changeset': 4, 'wiki': 1, 'closedticket': 1})
+        self.assertEqual(self._counts(BlipSet), {'trac': 1})
+
+    def test_tags_added_and_removed(self):
+        blip = Blip.objects.create(title=u"What I'm up to", summary=u"#wiki #new", timestamp=now())
+        blip.extract_tags()
+        self.assertEqual(self._counts(Blip), {'changeset': 4, 'wiki': 2, 'closedticket': 1, 'new': 1})
+        blip.tags.remove('wiki')
+        self.assertEqual(self._counts(Blip)['wiki'], 1)
+
+    def test_tag_deleted(self):
+        Tag.objects.get(name='wiki').delete()
+        self.assertEqual(self._counts(Blip), {'changeset': 4, 'closedticket': 1})
+        self.assertFalse(TagCount.objects.filter(count__lt=1).exists())
+
+    def test_bulk_add_queries_dont_grow(self):
+        def add(count):
+            bs = BlipSet.objects.create()
+            bulk_add_tags([(bs, ['new%d-%d' % (count, i) for i in range(count)] + ['wiki', 'trac'])])
+        queries = count_queries(add, 2)
+        self.assertEqual(count_queries(add, 20), queries)
+        self.assertEqual(self._counts(BlipSet)['new20-19'], 1)
+        self.assertEqual(self._counts(BlipSet)['trac'], 3)
+
+    def test_rebuild(self):
+        counts = self._counts(Blip)
+        TagCount.objects.all().delete()
+        call_command('rebuild_tag_counts', verbosity=0)
+        self.assertEqual(self._counts(Blip), counts)
+
+    @override_settings(TAGGIT_TAGCLOUD_MIN=10, TAGGIT_TAGCLOUD_MAX=24)
+    def test_tag_cloud(self):
+        with self.assertNumQueries(1):
+            tags = get_tag_cloud('pulse.Blip')
+        self.assertEqual([(t.name, t.num_times, t.weight) for t in tags],
+                         [('changeset', 4, 24), ('closedticket', 1, 10), ('wiki', 1, 10)])
+
 
 class ProviderSignalTest(TestCase):
     def setUp(self):
@@ -87,6 +564,18 @@ class FileSystemChangeProviderTest(TestCase):
         )
         self.provider.update()
 
+    def test_rerun_doesnt_duplicate(self):
+        # forget everything that would normally stop us re-reading the log
+        FileSystemChangeProvider.objects.update(last_update=datetime(1900, 1, 1, tzinfo=utc), log_offset=0)
+        provider = FileSystemChangeProvider.objects.get()
+        provider.update()
+        self.assertEqual(Blip.objects.count(), 7)
+        self.assertEqual(BlipSet.objects.count(), 1)
+
+    def test_blipset_stats(self):
+        bs = BlipSet.objects.get()
+        self.assertEqual((bs.blip_count, bs.authors), (7, ''))
+
     def test_load_all(self):
         self.assertQuerysetEqual(Blip.objects.all(), [
             '<Blip: Directory bar has been renamed from New folder to bar>',
@@ -103,6 +592,71 @@ class FileSystemChangeProviderTest(TestCase):
         self.assertEqual(b.timestamp, datetime(2011, 12, 17, 15, 57, 13, tzinfo=utc))
 
 
+class FileSystemChangeLogTailTest(TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.log_dir, 'ModifyLog.test.csv')
+        shutil.copy(os.path.join(TEST_DIR, 'modify.log'), self.log_path)
+        self.provider = FileSystemChangeProvider.objects.create(
+            update_frequency = 5,
+            change_log_path = self.log_path,
+            source_url_root = '//data/',
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def _append(self, text, mode='a'):
+        with open(self.log_path, mode) as f:
+            f.write(text)
+
+    def _fetch_titles(self):
+        """Fetch from a freshly loaded provider, so we know the fetch state made it to the DB"""
+        provider = FileSystemChangeProvider.objects.get(pk=self.provider.pk)
+        blips = provider._fetch_blips()
+        provider._save_fetch_state()
+        return [b.title for b in blips]
+
+    def test_reads_only_new_lines(self):
+        self.assertEqual(len(self._fetch_titles()), 7)
+        self.assertEqual(FileSystemChangeProvider.objects.get().log_offset, os.path.getsize(self.log_path))
+        self.assertEqual(self._fetch_titles(), [])
+        self._append('10:00:00 13:03:2012|/c/Administrative/|CREATE|new\n')
+        self.assertEqual(self._fetch_titles(), ['new has been created'])
+
+    def test_new_lines_kept_whatever_their_time(self):
+        self.provider.update()
+        # appended after last_update was set, but stamped earlier (say, in a time zone behind UTC)
+        self.assertTrue(FileSystemChangeProvider.objects.get().last_update > datetime(2012, 3, 14, tzinfo=utc))
+        self._append('10:00:00 13:03:2012|/c/Administrative/|CREATE|late\n')
+        self.assertEqual(self._fetch_titles(), ['late has been created'])
+
+    def test_partial_line_waits(self):
+        self._fetch_titles()
+        self._append('10:00:00 13:03:2012|/c/Administrative/|CRE')
+        self.assertEqual(self._fetch_titles(), [])
+        self._append('ATE|new\n')
+        self.assertEqual(self._fetch_titles(), ['new has been created'])
+
+    def test_move_across_fetches(self):
+        self._fetch_titles()
+        self._append('10:00:00 13:03:2012|/c/Administrative/|MOVED_FROM|old\n')
+        self.assertEqual(self._fetch_titles(), [])
+        self._append('10:00:00 13:03:2012|/c/Administrative/|MOVED_TO|new\n')
+        self.assertEqual(self._fetch_titles(), ['new has been renamed from old to new'])
+
+    def test_truncated_log(self):
+        self._fetch_titles()
+        self._append('10:00:00 13:03:2012|/c/Administrative/|DELETE|new\n', mode='w')
+        self.assertEqual(self._fetch_titles(), ['new has been deleted'])
+
+    def test_rotated_log(self):
+        self._fetch_titles()
+        os.rename(self.log_path, self.log_path + '.1')
+        self._append(open(self.log_path + '.1').read())
+        self.assertEqual(len(self._fetch_titles()), 7)
+
+
 class TracTimelineProviderTest(TestCase):
     def setUp(self):
         self.provider = TracTimelineProvider.objects.create(
@@ -132,4 +686,728 @@ class TracTimelineProviderTest(TestCase):
         b = Blip.objects.get(pk=5)
         self.assertQuerysetEqual(b.tags.all(), ['<Tag: wiki>',])
         b = Blip.objects.get(pk=6)
-        self.assertQuerysetEqual(b.tags.all(), ['<Tag: closedticket>',])
\ No newline at end of file
+        self.assertQuerysetEqual(b.tags.all(), ['<Tag: closedticket>',])
+
+    def test_rerun_doesnt_duplicate(self):
+        TracTimelineProvider.objects.update(last_update=datetime(1900, 1, 1, tzinfo=utc), content_hash='')
+        TracTimelineProvider.objects.get().update()
+        self.assertEqual(Blip.objects.count(), 6)
+        self.assertEqual(BlipSet.objects.count(), 1)
+
+    def test_unchanged_feed_skipped(self):
+        self.provider = TracTimelineProvider.objects.get()
+        self.assertTrue(self.provider.content_hash)
+        # even if we've forgotten when we last updated, an identical feed shouldn't be parsed again
+        self.provider.last_update = datetime(1900, 1, 1, tzinfo=utc)
+        self.provider.update()
+        self.assertEqual(BlipSet.objects.count(), 1)
+        self.assertEqual(Blip.objects.count(), 6)
+
+    def test_given_name_kept(self):
+        provider = TracTimelineProvider.objects.create(update_frequency=5, url=os.path.join(TEST_DIR, 'trac.xml'),
+                                                       name='Mine')
+        provider.update()
+        self.assertEqual(TracTimelineProvider.objects.get(pk=provider.pk).name, 'Mine')
+
+
+class KunenaProviderTest(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(handle, 'w') as f:
+            f.write('<?xml version="1.0"?>\n<rss version="2.0"><channel><title>Our Forum</title>'
+                    '<link>http://forum.example.com/</link><description>Forum</description>'
+                    '<item><title>General: Hello everyone :-) ...: Bob</title>'
+                    '<link>http://forum.example.com/1</link><description>Hello</description>'
+                    '<pubDate>Fri, 16 Mar 2012 12:00:00 GMT</pubDate></item>'
+                    '</channel></rss>\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_first_fetch_uses_feed_title(self):
+        provider = KunenaProvider.objects.create(update_frequency=5, url=self.path)
+        provider.update()
+        self.assertEqual(KunenaProvider.objects.get().name, 'Our Forum')
+        self.assertEqual(Blip.objects.get().title, 'Bob posted to Our Forum')
+
+
+class TimelineDayTest(TestCase):
+    def setUp(self):
+        # in Los Angeles (UTC-8) the first of these is still on March 1st
+        for hour, summary in ((6, "Late on the 1st"), (9, "Early on the 2nd"), (20, "Later on the 2nd")):
+            bs = BlipSet.objects.create(summary=summary)
+            bs.timestamp = datetime(2012, 3, 2, hour, tzinfo=utc)
+            bs.save()
+        bs = BlipSet.objects.create(summary="The 5th")
+        bs.timestamp = datetime(2012, 3, 5, 12, tzinfo=utc)
+        bs.save()
+
+    def test_day_range(self):
+        self.assertEqual(day_range(datetime(2012, 3, 2).date()),
+                         (datetime(2012, 3, 2, 8, tzinfo=utc), datetime(2012, 3, 3, 8, tzinfo=utc)))
+        # the day the clocks go forward is an hour short
+        start, end = day_range(datetime(2012, 3, 11).date())
+        self.assertEqual(end - start, timedelta(hours=23))
+
+    def test_count_by_day(self):
+        self.assertEqual(count_by_day(BlipSet.objects.all()),
+                         [(datetime(2012, 3, 5).date(), 1), (datetime(2012, 3, 2).date(), 2),
+                          (datetime(2012, 3, 1).date(), 1)])
+
+    def test_timeline_grouped_by_day(self):
+        response = self.client.get('/pulse/timeline')
+        self.assertEqual([(day.day, count, len(blipsets)) for day, count, blipsets in response.context['days']],
+                         [(5, 1, 1), (2, 2, 2), (1, 1, 1)])
+        self.assertContains(response, 'href="/pulse/timeline/2012/03/02"')
+
+    def test_day_archive(self):
+        response = self.client.get('/pulse/timeline/2012/03/02')
+        self.assertEqual([bs.summary for bs in response.context['object_list']], ["Later on the 2nd", "Early on the 2nd"])
+        self.assertEqual(response.context['older_day'], datetime(2012, 3, 1).date())
+        self.assertEqual(response.context['newer_day'], datetime(2012, 3, 5).date())
+
+        response = self.client.get('/pulse/timeline/2012/03/05')
+        self.assertIsNone(response.context['newer_day'])
+        self.assertEqual(self.client.get('/pulse/timeline/2012/02/30').status_code, 404)
+
+    def test_post_blip_from_day_archive(self):
+        response = self.client.post('/pulse/timeline/2012/03/02', {'summary': 'Writing tests #testing', 'who': 'Jane'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['day'], datetime(2012, 3, 2).date())
+        self.assertEqual(Blip.objects.get(who='Jane').summary, 'Writing tests #testing')
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.provider = Provider.objects.create(update_frequency=5, name='Keeper', retention_days=30)
+        self.old = self._add_blipset(self.provider, 40, ['old', 'shared'])
+        self.recent = self._add_blipset(self.provider, 10, ['shared'])
+        self.manual = self._add_blipset(None, 100, ['manual'])
+
+    def _add_blipset(self, provider, days_old, tags):
+        bs = BlipSet.objects.create(provider=provider)
+        BlipSet.objects.filter(pk=bs.pk).update(timestamp=now() - timedelta(days=days_old))
+        bs.tags.add(*tags)
+        for i in range(2):
+            b = Blip.objects.create(title='Blip %d from %d days ago' % (i, days_old), source_url='http://example.com',
+                                    who='Person %d' % i, timestamp=now() - timedelta(days=days_old), blipset=bs)
+            b.tags.add('blip')
+        return bs
+
+    def test_expired(self):
+        self.assertEqual(expired_blipsets(), [self.old.pk])
+        with override_settings(PULSE_RETENTION_DAYS=50):
+            self.assertEqual(expired_blipsets(), [self.manual.pk, self.old.pk])
+        Provider.objects.filter(pk=self.provider.pk).update(retention_days=None)
+        self.assertEqual(expired_blipsets(), [])
+
+    def test_archive(self):
+        old_blips = list(self.old.blips.order_by('pk'))
+        self.assertEqual(archive_expired(batch_size=1), (1, 2))
+
+        self.assertFalse(BlipSet.objects.filter(pk=self.old.pk).exists())
+        self.assertEqual(Blip.objects.count(), 4)
+        self.assertEqual(ArchivedBlip.objects.filter(blipset=self.old.pk).count(), 2)
+        self.assertFalse(Tag.objects.get(name='old').taggit_taggeditem_items.exists())
+        blipset_type = ContentType.objects.get_for_model(BlipSet)
+        self.assertEqual(TagCount.objects.get(tag__name='shared', content_type=blipset_type).count, 1)
+        self.assertEqual(TagCount.objects.get(tag__name='old', content_type=blipset_type).count, 0)
+        self.assertEqual(search_blips('Blip 40', 10), [])
+        self.assertEqual(len(search_blips('Blip 10', 10)), 2)
+
+        # the links still work
+        response = self.client.get('/pulse/%d' % self.old.pk)
+        self.assertContains(response, '2 new items fetched from Keeper')
+        self.assertContains(response, old_blips[0].title)
+        self.assertContains(response, 'href="/pulse/tags/old"')
+        response = self.client.get('/pulse/blip/%d' % old_blips[0].pk)
+        self.assertContains(response, old_blips[0].title)
+        self.assertContains(response, 'via Keeper')
+        self.assertEqual(self.client.get('/pulse/999').status_code, 404)
+
+        # nothing left to do the second time around
+        self.assertEqual(archive_expired(), (0, 0))
+
+    def test_lookups_batched(self):
+        Provider.objects.filter(pk=self.provider.pk).update(retention_days=None)
+        old_size, archive.LOOKUP_BATCH_SIZE = archive.LOOKUP_BATCH_SIZE, 1
+        try:
+            with override_settings(PULSE_RETENTION_DAYS=5):
+                self.assertEqual(archive_expired(), (3, 6))
+        finally:
+            archive.LOOKUP_BATCH_SIZE = old_size
+        self.assertFalse(Blip.objects.exists())
+        self.assertFalse(Tag.objects.get(name='blip').taggit_taggeditem_items.exists())
+        self.assertEqual(ArchivedBlip.objects.count(), 6)
+
+
+class FakeDocsClient(object):
+    """Stands in for gdata's DocsClient, serving canned revision feeds for documents last changed at the given times"""
+
+    class Element(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    def __init__(self, documents):
+        self.resources = []
+        for title, updated in documents:
+            self.resources.append(self.Element(
+                title=self.Element(text=title), updated=self.Element(text=updated),
+                author=[self.Element(name=self.Element(text='Owner'))],
+                GetAlternateLink=lambda title=title: self.Element(href='https://docs.google.com/%s' % title)))
+        self.revisions_fetched = []
+
+    def GetAllResources(self):
+        return self.resources
+
+    def get_revisions(self, resource):
+        self.revisions_fetched.append(resource.title.text)
+        with open(os.path.join(TEST_DIR, 'docs_revisions.xml')) as f:
+            return self.Element(ToString=lambda xml=f.read(): xml)
+
+
+class GdataStub(object):
+    """Puts stand-ins for the bits of gdata the provider imports into sys.modules, so the tests don't need it"""
+
+    class Unauthorized(Exception):
+        pass
+
+    def install(self):
+        self.saved = dict((name, sys.modules.get(name)) for name in ('gdata', 'gdata.client'))
+        gdata = types.ModuleType('gdata')
+        gdata.client = types.ModuleType('gdata.client')
+        gdata.client.Unauthorized = self.Unauthorized
+        sys.modules.update({'gdata': gdata, 'gdata.client': gdata.client})
+
+    def uninstall(self):
+        for name, module in self.saved.items():
+            if module is None:
+                del sys.modules[name]
+            else:
+                sys.modules[name] = module
+
+
+class GoogleDocsProviderTest(TestCase):
+    def setUp(self):
+        self.gdata = GdataStub()
+        self.gdata.install()
+        self.provider = GoogleDocsProvider.objects.create(update_frequency=5, email='jane@example.com',
+                                                          auth_token='token')
+        GoogleDocsProvider.objects.update(last_update=datetime(2011, 6, 1, tzinfo=utc))
+        self.provider = GoogleDocsProvider.objects.get()
+        self.client_ = FakeDocsClient([('Plans', '2012-03-02T17:00:00.000Z'), ('Minutes', '2011-02-01T10:00:00.000Z')])
+        self.provider._get_client = lambda: self.client_
+
+    def tearDown(self):
+        self.gdata.uninstall()
+
+    def test_only_changed_documents_crawled(self):
+        self.provider.update()
+        self.assertEqual(self.client_.revisions_fetched, ['Plans'])
+        blips = list(Blip.objects.order_by('-timestamp'))
+        self.assertEqual([(b.title, b.who, b.source_url) for b in blips],
+                         [('Plans', 'Jane Doe', 'https://docs.google.com/Plans'),
+                          ('Plans', 'Owner', 'https://docs.google.com/Plans')])
+        self.assertEqual(blips[0].summary, 'Plans edited')
+        self.assertEqual(UpdateRun.objects.get().entries_seen, 3)
+
+    def test_nothing_changed(self):
+        GoogleDocsProvider.objects.update(last_update=now())
+        provider = GoogleDocsProvider.objects.get()
+        provider._get_client = lambda: self.client_
+        self.assertEqual(provider._fetch_blips(), [])
+        self.assertEqual(self.client_.revisions_fetched, [])
+
+    def test_unauthorized(self):
+        def refuse():
+            raise GdataStub.Unauthorized("Forbidden")
+        self.client_.GetAllResources = refuse
+        self.assertRaises(GdataStub.Unauthorized, self.provider._fetch_blips)
+
+
+class BulkSaveTest(TestCase):
+    """Saving an update shouldn't cost more queries as the feed gets bigger"""
+    def setUp(self):
+        self.feed_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.feed_dir)
+
+    def _write_feed(self, count):
+        path = os.path.join(self.feed_dir, 'feed%d.xml' % count)
+        items = ''.join('<item><title>Changeset %d</title><link>http://example.com/%d</link>'
+                        '<description>Did stuff</description><pubDate>Thu, 15 Mar 2012 01:59:56 GMT</pubDate>'
+                        '<category>%s</category></item>' % (i, i, ('changeset', 'wiki')[i % 2])
+                        for i in range(count))
+        with open(path, 'w') as f:
+            f.write('<?xml version="1.0"?><rss version="2.0"><channel><title>feed</title>%s</channel></rss>' % items)
+        return path
+
+    def _count_update_queries(self, count):
+        provider = TracTimelineProvider.objects.create(update_frequency=5, url=self._write_feed(count))
+        provider.tags.add('trac')
+        return count_queries(provider.update)
+
+    def test_queries_dont_grow(self):
+        # the first update creates the tags, so it's left out of the comparison
+        self._count_update_queries(2)
+        few = self._count_update_queries(2)
+        many = self._count_update_queries(50)
+        self.assertEqual(few, many)
+        self.assertEqual(Blip.objects.count(), 54)
+        self.assertEqual(Blip.objects.filter(tags__name='wiki').count(), 27)
+        self.assertEqual(BlipSet.objects.filter(tags__name='trac').count(), 3)
+
+
+class StreamingFeedTest(TestCase):
+    def setUp(self):
+        self.feed_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.feed_dir, 'feed.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.feed_dir)
+
+    def _write_feed(self, items):
+        with open(self.path, 'w') as f:
+            f.write('<?xml version="1.0"?><rss version="2.0"><channel><title>feed</title>%s</channel></rss>' %
+                    ''.join('<item><title>%s</title><link>http://example.com/%s</link><description>Did stuff'
+                            '</description><pubDate>%s</pubDate></item>' % (title, title, date)
+                            for title, date in items))
+
+    def test_matches_feedparser(self):
+        path = os.path.join(TEST_DIR, 'trac.xml')
+        stream = EntryStream(open(path))
+        streamed = list(stream)
+        parsed = feedparser.parse(path)
+        self.assertEqual(stream.feed['title'], parsed['feed']['title'])
+        self.assertEqual(len(streamed), len(parsed['entries']))
+        for ours, theirs in zip(streamed, parsed['entries']):
+            for key in ('title', 'link', 'summary', 'updated_parsed', 'id', 'author'):
+                self.assertEqual(ours[key], theirs[key])
+            self.assertEqual(ours.author_detail['name'], theirs.author_detail['name'])
+            self.assertEqual([t['term'] for t in ours.tags], [t['term'] for t in theirs.tags])
+
+    def test_stops_at_old_entries(self):
+        self._write_feed([('two', 'Fri, 16 Mar 2012 10:00:00 GMT'), ('one', 'Thu, 15 Mar 2012 10:00:00 GMT')])
+        provider = RSSProvider.objects.create(update_frequency=5, url=self.path)
+        provider.update()
+        self.assertTrue(RSSProvider.objects.get().newest_first)
+        RSSProvider.objects.update(last_update=datetime(2012, 3, 16, 12, tzinfo=utc))
+
+        # were the entries after the first old one looked at, the bad date would blow up
+        self._write_feed([('three', 'Sat, 17 Mar 2012 10:00:00 GMT'), ('two', 'Fri, 16 Mar 2012 10:00:00 GMT'),
+                          ('one', 'not a date')])
+        RSSProvider.objects.get().update()
+        self.assertQuerysetEqual(Blip.objects.order_by('timestamp'), ['<Blip: one>', '<Blip: two>', '<Blip: three>'])
+
+    def test_out_of_order_feed_parsed_fully(self):
+        self._write_feed([('one', 'Thu, 15 Mar 2012 10:00:00 GMT'), ('two', 'Fri, 16 Mar 2012 10:00:00 GMT')])
+        provider = RSSProvider.objects.create(update_frequency=5, url=self.path)
+        provider.update()
+        self.assertFalse(RSSProvider.objects.get().newest_first)
+
+    def test_malformed_feed_falls_back(self):
+        self._write_feed([('Fish & Chips', 'Thu, 15 Mar 2012 10:00:00 GMT')])
+        provider = RSSProvider.objects.create(update_frequency=5, url=self.path)
+        provider.update()
+        self.assertQuerysetEqual(Blip.objects.all(), ['<Blip: Fish & Chips>'])
+
+
+class FeedRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        redirects = {'/moved': '/trac.xml', '/to-file': 'file://' + os.path.join(TEST_DIR, 'trac.xml')}
+        if self.path in redirects:
+            self.send_response(301 if self.path == '/moved' else 302)
+            self.send_header('Location', redirects[self.path])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path not in ('/trac.xml', '/private.xml', '/deflate.xml'):
+            self.send_error(404)
+            return
+        if self.path == '/private.xml' and self.headers.get('Authorization') != 'Basic dXNlcjpwQHNz':
+            self.send_response(401)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        with open(os.path.join(TEST_DIR, 'trac.xml'), 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        if self.path == '/deflate.xml':
+            # raw deflate, without the zlib header
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            self.send_header('Content-Encoding', 'deflate')
+        elif 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchTest(TestCase):
+    def setUp(self):
+        self.server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0), FeedRequestHandler)
+        self.server.daemon_threads = True
+        self.server.connections = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.session = Session(timeout=5)
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get(self, path, headers=None):
+        response = self.session.get(self.url + path, headers)
+        try:
+            return response.status, response.read()
+        finally:
+            response.close()
+
+    def test_connections_reused(self):
+        status, body = self._get('/trac.xml')
+        self.assertEqual(status, 200)
+        self.assertTrue(body.startswith('<?xml'))
+        self.assertEqual(self._get('/moved')[0], 200)
+        self.assertEqual(self._get('/trac.xml', {'If-None-Match': '"v1"'})[0], 304)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_error_status(self):
+        try:
+            self.session.get(self.url + '/missing')
+            self.fail("Expected a FetchError")
+        except FetchError as e:
+            self.assertEqual(e.status, 404)
+        self.assertRaises(FetchError, self.session.get, 'ftp://example.com/feed')
+
+    def test_compressed(self):
+        with open(os.path.join(TEST_DIR, 'trac.xml'), 'rb') as f:
+            expected = f.read()
+        response = self.session.get(self.url + '/trac.xml')
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        # read in small chunks, as the providers do
+        self.assertEqual(''.join(iter(lambda: response.read(100), '')), expected)
+        response.close()
+        self.assertEqual(self._get('/deflate.xml'), (200, expected))
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_credentials_in_url(self):
+        self.assertRaises(FetchError, self.session.get, self.url + '/private.xml')
+        response = self.session.get(self.url.replace('http://', 'http://user:p%40ss@') + '/private.xml')
+        self.assertEqual(response.status, 200)
+        response.close()
+
+        self.assertRaises(FetchError, self.session.get, self.url + '/to-file')
+        # though asking for a file directly is fine
+        response = self.session.get('file://' + os.path.join(TEST_DIR, 'trac.xml'))
+        self.assertEqual(response.status, 200)
+        response.close()
+
+    def test_session_defaults(self):
+        old_session, fetch._session = fetch._session, None
+        old_timeout = settings.PULSE_FETCH_TIMEOUT
+        del settings.PULSE_FETCH_TIMEOUT
+        try:
+            self.assertEqual(fetch.get_session().timeout, 30)
+        finally:
+            settings.PULSE_FETCH_TIMEOUT = old_timeout
+            fetch._session = old_session
+
+    def test_provider_uses_shared_session(self):
+        old_session, fetch._session = fetch._session, self.session
+        try:
+            provider = TracTimelineProvider.objects.create(update_frequency=5, url=self.url + '/trac.xml')
+            # nothing's fetched until the first update, which fills in the name
+            self.assertEqual(len(self.server.connections), 0)
+            self.assertEqual(provider.name, self.url + '/trac.xml')
+            provider.update()
+            self.assertEqual(TracTimelineProvider.objects.get().name, 'project')
+            self.assertFalse(TracTimelineProvider.objects.get().name_pending)
+            self.assertEqual(BlipSet.objects.get().__unicode__(), '6 new items fetched from project')
+            self.assertEqual(Blip.objects.count(), 6)
+            self.assertEqual(TracTimelineProvider.objects.get().etag, '"v1"')
+
+            # the ETag is sent back, and the 304 means nothing more is done
+            TracTimelineProvider.objects.update(last_update=datetime(1900, 1, 1, tzinfo=utc), content_hash='')
+            TracTimelineProvider.objects.get().update()
+            self.assertEqual(BlipSet.objects.count(), 1)
+        finally:
+            fetch._session = old_session
+        self.assertEqual(len(self.server.connections), 1)
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run(self):
+        results = bench.run(self.directory, providers=3, entries=10, log_lines=20, blipsets=10, blips=30, repeat=1)
+        by_name = dict((r['name'], r) for r in results)
+        self.assertEqual(by_name['update.TracTimelineProvider']['blips'], 10)
+        self.assertEqual(by_name['parse.feed']['blips'], 10)
+        self.assertEqual(by_name['timeline.cold']['status'], 200)
+        self.assertEqual(Blip.objects.filter(blipset__provider=None).count(), 30)
+        for result in results:
+            self.assertTrue(result['wall_time'] >= 0)
+            self.assertTrue(result['peak_rss_kb'] > 0)
+
+
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.due = FileSystemChangeProvider.objects.create(
+            update_frequency = 5,
+            change_log_path = os.path.join(TEST_DIR, 'modify.log'),
+            source_url_root = '//data/',
+        )
+        self.not_due = FileSystemChangeProvider.objects.create(
+            update_frequency = 5,
+            change_log_path = os.path.join(TEST_DIR, 'modify.log'),
+            source_url_root = '//data/',
+        )
+        FileSystemChangeProvider.objects.filter(pk=self.not_due.pk).update(last_update=now())
+        self.scheduler = Scheduler(refresh_interval=3600)
+
+    def test_only_due_providers(self):
+        results = self.scheduler.run_pending()
+        self.assertEqual([r.provider.pk for r in results], [self.due.pk])
+        self.assertEqual(BlipSet.objects.get().provider_id, self.due.pk)
+        # nothing else is due for another 5 minutes
+        self.assertEqual(self.scheduler.run_pending(), [])
+        self.assertTrue(240 < self.scheduler.seconds_until_next() <= 300)
+
+    def test_quiet_provider_not_retried(self):
+        self.due.change_log_path = os.path.join(TEST_DIR, 'does-not-exist.log')
+        self.due.save()
+        self.assertEqual(len(self.scheduler.run_pending()), 1)
+        self.scheduler.refresh()
+        self.assertEqual(self.scheduler.run_pending(), [])
+
+    def test_picks_up_changes(self):
+        self.scheduler.run_pending()
+        FileSystemChangeProvider.objects.filter(pk=self.not_due.pk).update(last_update=datetime(1900, 1, 1, tzinfo=utc))
+        self.assertEqual(self.scheduler.run_pending(), [])
+        self.scheduler.refresh()
+        self.assertEqual([r.provider.pk for r in self.scheduler.run_pending()], [self.not_due.pk])
+
+    def test_keeps_going_after_errors(self):
+        class Stop(Exception):
+            pass
+        sleeps = []
+        class FakeTime(object):
+            @staticmethod
+            def sleep(seconds):
+                sleeps.append(seconds)
+                if len(sleeps) == 2:
+                    raise Stop()
+        refresh = self.scheduler.refresh
+        def flaky_refresh():
+            self.scheduler.refresh = refresh
+            raise DatabaseError("server closed the connection unexpectedly")
+        self.scheduler.refresh = flaky_refresh
+
+        scheduler.time = FakeTime
+        try:
+            self.assertRaises(Stop, self.scheduler.run_forever)
+        finally:
+            scheduler.time = time
+        self.assertEqual(sleeps[0], scheduler.ERROR_BACKOFF)
+        self.assertEqual(BlipSet.objects.get().provider_id, self.due.pk)
+
+
+class StubProvider(object):
+    """Enough of a provider for update_providers, updating without touching the database"""
+
+    def __init__(self, name, delay=0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.thread = None
+
+    def __unicode__(self):
+        return self.name
+
+    def update(self):
+        self.thread = threading.current_thread()
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+
+class UpdateEngineTest(TestCase):
+    def setUp(self):
+        self.good = FileSystemChangeProvider.objects.create(
+            update_frequency = 5,
+            change_log_path = os.path.join(TEST_DIR, 'modify.log'),
+            source_url_root = '//data/',
+        )
+        self.bad = FileSystemChangeProvider.objects.create(
+            update_frequency = 5,
+            change_log_path = os.path.join(TEST_DIR, 'does-not-exist.log'),
+            source_url_root = '//data/',
+        )
+
+    def test_failure_is_contained(self):
+        results = update_providers(Provider.objects.order_by('pk'))
+        self.assertEqual([r.provider.pk for r in results], [self.good.pk, self.bad.pk])
+        self.assertIsNone(results[0].error)
+        self.assertIsInstance(results[1].error, IOError)
+        self.assertEqual(Blip.objects.count(), 7)
+        self.assertEqual(BlipSet.objects.get().provider_id, self.good.pk)
+
+    def test_worker_pool(self):
+        # the slow first one finishes last, but the results still come back in order
+        providers = [StubProvider('slow', delay=0.2), StubProvider('broken', error=IOError("gone")),
+                     StubProvider('fine'), StubProvider('also fine')]
+        results = update_providers(providers, workers=2)
+        self.assertEqual([r.provider.name for r in results], ['slow', 'broken', 'fine', 'also fine'])
+        self.assertEqual([type(r.error) for r in results], [type(None), IOError, type(None), type(None)])
+        self.assertTrue(results[0].elapsed >= 0.2)
+        for provider in providers:
+            self.assertNotEqual(provider.thread, threading.current_thread())
+        self.assertEqual(len(set(p.thread for p in providers)), 2)
+
+    def test_pipeline(self):
+        trac = TracTimelineProvider.objects.create(update_frequency=5, url=os.path.join(TEST_DIR, 'trac.xml'))
+        results = run_pipeline(Provider.objects.order_by('pk'), fetch_workers=3)
+        self.assertEqual([r.provider.pk for r in results], [self.good.pk, self.bad.pk, trac.pk])
+        self.assertIsNone(results[0].error)
+        self.assertIsInstance(results[1].error, IOError)
+        self.assertIsNone(results[2].error)
+        self.assertEqual(Blip.objects.count(), 13)
+        self.assertEqual(BlipSet.objects.get(provider=trac).blip_count, 6)
+
+        # nothing's due the second time around
+        results = run_pipeline(Provider.objects.order_by('pk'), fetch_workers=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(BlipSet.objects.count(), 2)
+
+
+class UpdateRunTest(TestCase):
+    def setUp(self):
+        self.provider = FileSystemChangeProvider.objects.create(
+            update_frequency = 5,
+            change_log_path = os.path.join(TEST_DIR, 'modify.log'),
+            source_url_root = '//data/',
+        )
+
+    def test_run_recorded(self):
+        self.provider.update()
+        run = UpdateRun.objects.get()
+        self.assertEqual(run.provider_id, self.provider.pk)
+        self.assertEqual(run.bytes_downloaded, os.path.getsize(self.provider.change_log_path))
+        self.assertEqual(run.blips_created, 7)
+        self.assertTrue(run.entries_seen >= 7)
+        self.assertEqual(run.error, '')
+        self.assertTrue(run.duration > 0)
+
+    def test_failure_recorded(self):
+        bad = FileSystemChangeProvider.objects.create(
+            update_frequency = 5,
+            change_log_path = os.path.join(TEST_DIR, 'does-not-exist.log'),
+            source_url_root = '//data/',
+        )
+        run_pipeline([self.provider, bad], fetch_workers=2)
+        self.assertEqual(UpdateRun.objects.get(provider=self.provider).blips_created, 7)
+        self.assertIn('IOError', UpdateRun.objects.get(provider=bad).error)
+
+    @override_settings(PULSE_UPDATE_RUN_HISTORY=3)
+    def test_history_trimmed(self):
+        for i in xrange(5):
+            self.provider.begin_run()
+            self.provider.end_run()
+        self.assertEqual(self.provider.update_runs.count(), 3)
+
+    def test_quiet_feed_not_stale(self):
+        # nothing new for a day, but it's been checked successfully just now
+        FileSystemChangeProvider.objects.update(last_update=now() - timedelta(days=1))
+        provider = FileSystemChangeProvider.objects.get()
+        provider.begin_run()
+        provider.end_run()
+        status = all_provider_status()[0]
+        self.assertTrue(status['staleness'] < 1)
+        self.assertEqual(status['last_new_content'], provider.last_update)
+
+        # whereas failures don't count
+        UpdateRun.objects.update(error='IOError: gone', started=now() - timedelta(hours=1))
+        self.assertTrue(all_provider_status()[0]['staleness'] > 2)
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([3, 1, 2], 0.5), 2)
+        self.assertEqual(percentile(range(1, 101), 0.95), 95)
+        self.assertEqual(percentile([7], 0.95), 7)
+
+    def test_status(self):
+        self.provider.update()
+        self.provider.begin_run()
+        self.provider.end_run(ValueError("broken"))
+        status = all_provider_status()[0]
+        self.assertEqual(status['runs'], 2)
+        self.assertEqual(status['failures'], 1)
+        self.assertEqual(status['last_error'].error, 'ValueError: broken')
+        self.assertTrue(status['staleness'] < 1)
+
+        out = StringIO()
+        call_command('provider_status', stdout=out)
+        self.assertIn('2 runs (1 failed)', out.getvalue())
+
+        # anyone else gets the admin login form
+        self.assertNotContains(self.client.get('/pulse/status'), 'ValueError: broken')
+        user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        user.is_staff = True
+        user.save()
+        self.client.login(username='staff', password='secret')
+        response = self.client.get('/pulse/status')
+        self.assertContains(response, 'ValueError: broken')
+
+
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        profiles.clear()
+
+    @override_settings(PULSE_PROFILE_RATE=0)
+    def test_disabled(self):
+        self.assertRaises(MiddlewareNotUsed, ProfilingMiddleware)
+        Client().get('/pulse/timeline')
+        self.assertEqual(profiles.summary(), {})
+
+    @override_settings(PULSE_PROFILE_RATE=1)
+    def test_profiles_per_url_name(self):
+        BlipSet.objects.create(summary='Something happened')
+        client = Client()
+        client.get('/pulse/timeline')
+        client.get('/pulse/timeline')
+        timeline = profiles.summary()['timeline']
+        self.assertEqual(timeline['requests'], 2)
+        self.assertTrue(timeline['queries'] > 0)
+        self.assertTrue(timeline['template_time'] > 0)
+        self.assertTrue(timeline['latency'] >= timeline['template_time'])
+        self.assertEqual(timeline['mean_queries'], timeline['queries'] / 2.0)
+
+        user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        user.is_staff = True
+        user.save()
+        client.login(username='staff', password='secret')
+        response = client.get('/pulse/profile')
+        self.assertEqual(json.loads(response.content)['timeline']['requests'], 2)
@@ -1,19 +1,32 @@
 from django.conf.urls.defaults import patterns, include, url
-from django.views.generic import DetailView, TemplateView
-from taggit.views import tagged_object_list
+from django.views.generic import TemplateView
 
-from pulse.models import BlipSet, Blip
-from pulse.views import Timeline
+from pulse import api
+from pulse.feeds import blip_feed, blipset_feed
+from pulse.views import (BlipDetail, BlipSetDetail, Search, TaggedBlips, TaggedBlipSets, Timeline, TimelineDay,
+                         profile, status)
 
 
 urlpatterns = patterns('',
     # blipset views
     url(r'^timeline$', Timeline.as_view(), name='timeline'),
-    url(r'^(?P<slug>\w+)$', DetailView.as_view(model=BlipSet, slug_field='pk'), name='blipset_detail'),
-    url(r'^tags/(?P<slug>[A-Za-z0-9_\-]+)$', tagged_object_list, {'queryset' : BlipSet.objects.all()}, name='blipset_tags'),
+    url(r'^timeline/feed$', blipset_feed, name='timeline_feed'),
+    url(r'^timeline/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})$', TimelineDay.as_view(), name='timeline_day'),
+    url(r'^search$', Search.as_view(), name='search'),
+    url(r'^status$', status, name='status'),
+    url(r'^profile$', profile, name='profile'),
+    url(r'^(?P<slug>\w+)$', BlipSetDetail.as_view(), name='blipset_detail'),
+    url(r'^tags/(?P<slug>[A-Za-z0-9_\-]+)$', TaggedBlipSets.as_view(), name='blipset_tags'),
+    url(r'^tags/(?P<slug>[A-Za-z0-9_\-]+)/feed$', blipset_feed, name='blipset_tags_feed'),
     # blip views
-    url(r'^blip/(?P<slug>\w+)$', DetailView.as_view(model=Blip, slug_field='pk'), name='blip_detail'),
-    url(r'^blip/tags/(?P<slug>[A-Za-z0-9_\-]+)$', tagged_object_list, {'queryset' : Blip.objects.all()}, name='blip_tags'),
+    url(r'^blip/(?P<slug>\w+)$', BlipDetail.as_view(), name='blip_detail'),
+    url(r'^blip/tags/(?P<slug>[A-Za-z0-9_\-]+)$', TaggedBlips.as_view(), name='blip_tags'),
+    url(r'^blip/tags/(?P<slug>[A-Za-z0-9_\-]+)/feed$', blip_feed, name='blip_tags_feed'),
+    # JSON API
+    url(r'^api/blipsets$', api.blipsets, name='api_blipsets'),
+    url(r'^api/blips$', api.blips, name='api_blips'),
+    url(r'^api/tags$', api.tags, name='api_tags'),
+    url(r'^api/search$', api.search, name='api_search'),
 
 
 )
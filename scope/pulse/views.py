@@ -1,13 +1,27 @@
+import datetime
+import json
+
 from bootstrap.forms import BootstrapForm
 import django_filters
 from django import forms
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.contenttypes.models import ContentType
-from django.utils.timezone import now
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.timezone import localtime, now
+from django.views.generic import DetailView, ListView
 from django.views.generic.base import TemplateResponseMixin, View
-from taggit.models import TaggedItem
+from taggit.models import Tag, TaggedItem
 
-from pulse.forms import TagFilterForm, BlipCreateForm
-from pulse.models import BlipSet, Blip
+from pulse.forms import TagFilterForm, BlipCreateForm, SearchForm
+from pulse.middleware import profiles
+from pulse.models import (ArchivedBlip, ArchivedBlipSet, BlipSet, Blip, count_by_day, day_range, prefetch_blipsets,
+                          prefetch_tags)
+from pulse.pagination import decode_cursor, paginate
+from pulse.search import SearchUnavailable, search_blips
+from pulse.status import all_provider_status
 
 
 class BlipSetFilterSet(django_filters.FilterSet):
@@ -22,6 +36,144 @@ class BlipSetFilterSet(django_filters.FilterSet):
         self.filters['timestamp'].widget = forms.Select(attrs={'class':'span2'})
 
 
+class BlipFilterSet(django_filters.FilterSet):
+    timestamp = django_filters.DateRangeFilter(label='Date')
+    class Meta:
+        model = Blip
+        fields = ['timestamp', 'blipset']
+
+
+def filter_by_tags(queryset, tag_filter_form):
+    """Narrow a queryset of tagged objects down to those with any of the tags chosen in the (bound) TagFilterForm"""
+    if tag_filter_form.is_valid():
+        selected_tags = tag_filter_form.cleaned_data['tags']
+        if selected_tags:
+            content_type = ContentType.objects.get_for_model(queryset.model)
+            tagged_items = TaggedItem.objects.filter(tag__in=selected_tags, content_type=content_type)
+            # Todo: do we want the tags to be an AND or an OR filter?  Right now it's an OR
+            queryset = queryset.filter(pk__in=tagged_items.values_list('object_id', flat=True))
+    return queryset
+
+
+def get_cursors(data):
+    """Decode the ``before``/``after`` cursors in the query data, as keyword arguments for paginate()"""
+    cursors = {}
+    for direction in ('before', 'after'):
+        if data.get(direction):
+            try:
+                cursors[direction] = decode_cursor(data[direction])
+            except ValueError:
+                pass    # a mangled link, just start from the top
+    return cursors
+
+
+def get_page_number(data):
+    try:
+        return max(1, int(data.get('page', 1)))
+    except ValueError:
+        return 1
+
+
+def find_blips(query, per_page, page=1):
+    """A page of the blips matching a search, best match first, along with whether there's another page after it"""
+    pks = search_blips(query, per_page + 1, (page - 1) * per_page)
+    has_next = len(pks) > per_page
+    pks = pks[:per_page]
+    blips = Blip.objects.select_related('blipset__provider').in_bulk(pks)
+    object_list = [blips[pk] for pk in pks if pk in blips]
+    prefetch_tags(object_list)
+    return object_list, has_next
+
+
+def group_by_day(blipsets, queryset):
+    """Split a page of blipsets up by local day, as (day, count, blipsets) with each day's count from the queryset
+
+    The counts cover the whole of each day, not just the part of it on this page, and take a single query
+    """
+    days = []
+    for blipset in blipsets:
+        day = localtime(blipset.timestamp).date()
+        if not days or days[-1][0] != day:
+            days.append((day, []))
+        days[-1][1].append(blipset)
+    if not days:
+        return []
+    start, end = day_range(days[-1][0])[0], day_range(days[0][0])[1]
+    counts = dict(count_by_day(queryset.filter(timestamp__gte=start, timestamp__lt=end)))
+    return [(day, counts.get(day, len(on_page)), on_page) for day, on_page in days]
+
+
+class ArchiveFallbackDetailView(DetailView):
+    """A DetailView which, for an object the retention policy has archived, shows the restored archive copy"""
+    archive_model = None
+    slug_field = 'pk'
+
+    def get_object(self, queryset=None):
+        try:
+            obj = super(ArchiveFallbackDetailView, self).get_object(queryset)
+        except Http404:
+            try:
+                return self.archive_model.objects.get(pk=self.kwargs.get('slug')).restore()
+            except (self.archive_model.DoesNotExist, ValueError):
+                raise Http404("No %s found matching the query" % self.model._meta.verbose_name)
+        self.prefetch(obj)
+        return obj
+
+    def prefetch(self, obj):
+        """Load everything the template needs for a live (not archived) object"""
+        prefetch_tags([obj])
+
+
+class BlipSetDetail(ArchiveFallbackDetailView):
+    model = BlipSet
+    archive_model = ArchivedBlipSet
+    queryset = BlipSet.objects.select_related('provider')
+
+    def prefetch(self, blipset):
+        blipset._blip_list_cache = list(blipset.blips.all())
+        for blip in blipset.blip_list:
+            blip.blipset = blipset
+        prefetch_tags([blipset])
+        prefetch_tags(blipset.blip_list)
+
+
+class BlipDetail(ArchiveFallbackDetailView):
+    model = Blip
+    archive_model = ArchivedBlip
+    queryset = Blip.objects.select_related('blipset__provider')
+
+
+class TaggedList(ListView):
+    """Like taggit's tagged_object_list, but loading everything the fragments need for the whole list up front"""
+
+    def get_queryset(self):
+        self.tag = get_object_or_404(Tag, slug=self.kwargs['slug'])
+        content_type = ContentType.objects.get_for_model(self.queryset.model)
+        tagged_items = TaggedItem.objects.filter(tag=self.tag, content_type=content_type)
+        return self.queryset.filter(pk__in=tagged_items.values_list('object_id', flat=True))
+
+    def prefetch(self, objects):
+        prefetch_tags(objects)
+
+    def get_context_data(self, **kwargs):
+        kwargs['object_list'] = list(kwargs['object_list'])
+        self.prefetch(kwargs['object_list'])
+        context = super(TaggedList, self).get_context_data(**kwargs)
+        context['tag'] = self.tag
+        return context
+
+
+class TaggedBlipSets(TaggedList):
+    queryset = BlipSet.objects.select_related('provider')
+
+    def prefetch(self, blipsets):
+        prefetch_blipsets(blipsets)
+
+
+class TaggedBlips(TaggedList):
+    queryset = Blip.objects.select_related('blipset__provider')
+
+
 class Timeline(View, TemplateResponseMixin):
     template_name = 'pulse/timeline.html'
 
@@ -39,19 +191,37 @@ class Timeline(View, TemplateResponseMixin):
     def get(self, request, *args, **kwargs):
         # filter by tags if there are any
         tag_filter_form = TagFilterForm(request.GET or None)
-        queryset = BlipSet.objects.all()
-        if tag_filter_form.is_valid():
-            selected_tags = tag_filter_form.cleaned_data['tags']
-            if selected_tags:
-                blipset_content_type = ContentType.objects.get_for_model(queryset.model)
-                tagged_blipsets = TaggedItem.objects.filter(tag__in=selected_tags, content_type=blipset_content_type)
-                # Todo: do we want the tags to be an AND or an OR filter?  Right now it's an OR
-                queryset = queryset.filter(pk__in=tagged_blipsets.values_list('object_id', flat=True))
-
-        context = self.get_context_data(filter=BlipSetFilterSet(request.GET, queryset=queryset),
-                                        tag_filter_form=tag_filter_form)
+        queryset = filter_by_tags(self.get_queryset(), tag_filter_form)
+        blipset_filter = BlipSetFilterSet(request.GET, queryset=queryset)
+        page = self.get_page(blipset_filter.qs)
+        prefetch_blipsets(page.object_list)
+        context = self.get_context_data(filter=blipset_filter,
+                                        tag_filter_form=tag_filter_form,
+                                        page=page,
+                                        object_list=page.object_list,
+                                        days=group_by_day(page.object_list, blipset_filter.qs),
+                                        newer_url=self.get_page_url('after', page.newer_cursor),
+                                        older_url=self.get_page_url('before', page.older_cursor))
         return self.render_to_response(context)
 
+    def get_queryset(self):
+        return BlipSet.objects.select_related('provider')
+
+    def get_page(self, queryset):
+        """Grab the page of blipsets asked for by the ``before``/``after`` cursors, or the newest page"""
+        per_page = getattr(settings, 'PULSE_TIMELINE_PAGE_SIZE', 50)
+        return paginate(queryset, per_page, **get_cursors(self.request.GET))
+
+    def get_page_url(self, direction, cursor):
+        """Link to another page, keeping all of the current filters"""
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        for key in ('before', 'after'):
+            query.pop(key, None)
+        query[direction] = cursor
+        return '?%s' % query.urlencode()
+
     def post(self, request, *args, **kwargs):
         # did anyone post a Blip?
         blip_create_form = BlipCreateForm(request.POST or None)
@@ -75,4 +245,69 @@ class Timeline(View, TemplateResponseMixin):
         else:
             self._context['blip_create_form'] = blip_create_form
 
-        return self.get(request)
\ No newline at end of file
+        return self.get(request, *args, **kwargs)
+
+class TimelineDay(Timeline):
+    """Everything on the timeline for a single local day, found with a range query on the timestamps"""
+    template_name = 'pulse/timeline_day.html'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.day = datetime.date(int(kwargs['year']), int(kwargs['month']), int(kwargs['day']))
+        except ValueError:
+            raise Http404("No such day")
+        self.start, self.end = day_range(self.day)
+        return super(TimelineDay, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return super(TimelineDay, self).get_queryset().filter(timestamp__gte=self.start, timestamp__lt=self.end)
+
+    def get_context_data(self, **kwargs):
+        everything = BlipSet.objects.all()
+        older = everything.filter(timestamp__lt=self.start).order_by('-timestamp').values_list('timestamp', flat=True)
+        newer = everything.filter(timestamp__gte=self.end).order_by('timestamp').values_list('timestamp', flat=True)
+        return super(TimelineDay, self).get_context_data(day=self.day,
+                                                         older_day=self.get_day(older[:1]),
+                                                         newer_day=self.get_day(newer[:1]),
+                                                         **kwargs)
+
+    def get_day(self, timestamps):
+        return localtime(timestamps[0]).date() if timestamps else None
+
+
+class Search(View, TemplateResponseMixin):
+    template_name = 'pulse/search.html'
+
+    def get(self, request, *args, **kwargs):
+        form = SearchForm(request.GET or None)
+        context = {'form': form, 'object_list': [], 'previous_url': None, 'next_url': None, 'unavailable': False}
+        if form.is_valid():
+            page = get_page_number(request.GET)
+            per_page = getattr(settings, 'PULSE_TIMELINE_PAGE_SIZE', 50)
+            try:
+                context['object_list'], has_next = find_blips(form.cleaned_data['q'], per_page, page)
+            except SearchUnavailable:
+                context['unavailable'] = True
+            else:
+                if page > 1:
+                    context['previous_url'] = self.get_page_url(page - 1)
+                if has_next:
+                    context['next_url'] = self.get_page_url(page + 1)
+        return self.render_to_response(context)
+
+    def get_page_url(self, page):
+        query = self.request.GET.copy()
+        query['page'] = page
+        return '?%s' % query.urlencode()
+
+
+@staff_member_required
+def status(request):
+    """How the providers' recent updates went: timings, volumes, errors and how far behind each one is"""
+    return TemplateResponse(request, 'pulse/status.html', {'providers': all_provider_status()})
+
+
+@staff_member_required
+def profile(request):
+    """The request profiles gathered by pulse.middleware.ProfilingMiddleware in this process, as JSON"""
+    return HttpResponse(json.dumps(profiles.summary(), indent=2, sort_keys=True), content_type='application/json')
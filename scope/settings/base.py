@@ -49,6 +49,7 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'pulse.middleware.ProfilingMiddleware',
 )
 
 ROOT_URLCONF = 'scope.urls'
@@ -101,6 +102,32 @@ LOGGING = {
 TAGGIT_TAGCLOUD_MIN = 10
 TAGGIT_TAGCLOUD_MAX = 24
 
+# number of blipsets on each page of the timeline
+PULSE_TIMELINE_PAGE_SIZE = 50
+# the most objects the JSON API will return on a page, whatever `limit` is asked for
+PULSE_API_MAX_PAGE_SIZE = 500
+# number of entries in each of the Atom feeds
+PULSE_FEED_SIZE = 50
+# PostgreSQL text search configuration used to index and search blips
+PULSE_SEARCH_CONFIG = 'english'
+
+# cache (one of the CACHES aliases) holding rendered blips/blipsets, and how long they're kept (secs).  A cache shared
+# by all of the processes, e.g. file-based or memcached, lets them reuse each other's fragments
+PULSE_FRAGMENT_CACHE = 'default'
+PULSE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# providers fetch over keep-alive connections pooled per host: how long to wait on a server (secs) and how many
+# requests can be in flight to any one host at a time
+PULSE_FETCH_TIMEOUT = 30
+PULSE_FETCH_MAX_PER_HOST = 4
+# number of update runs kept for each provider, for the status page and provider_status command
+PULSE_UPDATE_RUN_HISTORY = 100
+# days blipsets are kept before archive_blipsets moves them out of the timeline, for providers without their own
+# retention_days (None keeps them forever)
+PULSE_RETENTION_DAYS = None
+# fraction of requests profiled by pulse.middleware.ProfilingMiddleware (0 turns it off, 1 profiles everything)
+PULSE_PROFILE_RATE = 0
+
 try:
     from local_settings import *
 except ImportError: